@@ -1,12 +1,20 @@
-# from pvp.server import *
-import pandas as pd
-from mesa.batchrunner import BatchRunner
-
-from pvp.model import ProtestersVsPolice
+from pvp.batch import expand, final, run_batch
+from pvp.cache import ResultCache
+from pvp.sweep import Sweep
 
 # JUST CHANGE THESE
 iterations = 2  # no of times to run exp with same params
 max_steps = 500  # no of steps in a single exper
+workers = None  # no of processes, None uses every core
+seed = 0  # replicate i runs with seed + i
+ensemble = False  # run the replicates of a parameter set together on the array engine
+cache_dir = (
+    "experiments/cache"  # reuse the results of runs done before, None always simulates
+)
+sweep_db = None  # eg. "experiments/sweep.db": queue the runs there, so a crashed or stopped batch picks up where it was
+checkpoint_every = (
+    100  # steps between snapshots of a queued run, for the next worker to carry on from
+)
 
 model_params_batch = {
     "max_iters": max_steps,
@@ -20,29 +28,39 @@ model_params_batch = {
     "width": 40,
     "citizen_vision": 7,
     "cop_vision": 7,
-    "legitimacy": 0.8,
     "max_jail_term": 1000,
     "barricade": 50,
+    "converge_window": 50,  # stop runs whose counts stayed flat this many steps, None runs to max_steps
+    "converge_tolerance": 0.02,
     "funmode": False,  # Set to True for sound effects
 }
+# eg. {"ratio": [0.5, 0.8]} runs every combination of these with the params above
+variable_params_batch = {}
 
 # IGNORE BELOW
 
-nice_param_string = [f"{x}_{model_params_batch[x]}" for x in model_params_batch.keys()]
-
-df_final = pd.DataFrame(index=["Quiescent", "Active", "Deviant", "Jailed"])
-for i in range(iterations):
-    batch_run = BatchRunner(
-        ProtestersVsPolice,
-        fixed_parameters=model_params_batch,
-        iterations=1,
-        max_steps=max_steps,
-    )
-    batch_run.run_all()
-
-    data_collector_agents = batch_run.get_collector_model()
-    tes = data_collector_agents[list(data_collector_agents.keys())[-1]]
-    df_final = df_final.append(tes.iloc[-1])
-    df_final = df_final.dropna()
-
-print(df_final.mean())
+if __name__ == "__main__":
+    param_sets = expand(model_params_batch, variable_params_batch)
+    cache = ResultCache(cache_dir) if cache_dir else None
+    if sweep_db:
+        sweep = Sweep(sweep_db, checkpoint_every=checkpoint_every)
+        sweep.add(param_sets, replicates=iterations, max_steps=max_steps, seed=seed)
+        print(sweep.run(workers=workers, cache=cache))
+        df = sweep.frame()
+    else:
+        df = run_batch(
+            param_sets,
+            replicates=iterations,
+            max_steps=max_steps,
+            seed=seed,
+            workers=workers,
+            ensemble=ensemble,
+            cache=cache,
+        )
+    df_final = final(df)
+    group = list(variable_params_batch)
+    columns = ["Quiescent", "Active", "Deviant", "Jailed"]
+    if group:
+        print(df_final.groupby(group)[columns].mean())
+    else:
+        print(df_final[columns].mean())
@@ -0,0 +1,174 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from pvp.model import ProtestersVsPolice
+
+# JUST CHANGE THESE
+steps = 50  # steps timed per case
+matrix = {
+    "size": [40, 100, 200],
+    "grid_density": [0.7],
+    "environment": [
+        "Random distribution",
+        "Block in the middle",
+        "Cops in the middle",
+        "Wall of cops",
+        "Street",
+    ],
+    "wrap": ["Wrap around", "Don't wrap around"],
+    "direction_bias": ["Random", "Clockwise"],
+    "engine": ["agents", "array", "compiled"],
+}
+quick_matrix = {  # --quick
+    "size": [40],
+    "grid_density": [0.7],
+    "environment": ["Random distribution", "Street"],
+    "wrap": ["Wrap around"],
+    "direction_bias": ["Random"],
+    "engine": ["agents", "array"],
+}
+fixed_params = {"seed": 0, "log_every": None, "record_every": None}
+
+# IGNORE BELOW
+
+
+def cases(matrix):
+    names = list(matrix)
+    for values in itertools.product(*(matrix[n] for n in names)):
+        yield dict(zip(names, values))
+
+
+def case_key(case):
+    return "|".join(f"{k}={case[k]}" for k in sorted(case))
+
+
+def run_case(case, steps):
+    """
+    Time one case, in its own process so the peak memory is its own
+    """
+    params = {k: v for k, v in case.items() if k != "size"}
+    t = time.perf_counter()
+    model = ProtestersVsPolice(
+        height=case["size"],
+        width=case["size"],
+        max_iters=steps + 1,
+        **params,
+        **fixed_params,
+    )
+    setup = time.perf_counter() - t
+
+    times = []
+    for _ in range(steps):
+        t = time.perf_counter()
+        model.step()
+        times.append(time.perf_counter() - t)
+    times = np.array(times)
+    # ru_maxrss is in kilobytes on linux, bytes on mac
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "key": case_key(case),
+        "case": case,
+        "setup_s": setup,
+        "steps_per_s": len(times) / times.sum(),
+        "step_ms_p50": 1000 * np.percentile(times, 50),
+        "step_ms_p90": 1000 * np.percentile(times, 90),
+        "step_ms_p99": 1000 * np.percentile(times, 99),
+        "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(out, quick=False, steps=steps):
+    todo = list(cases(quick_matrix if quick else matrix))
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for i, case in enumerate(todo):
+            result = pool.apply(run_case, (case, steps))
+            results.append(result)
+            print(
+                f"[{i + 1}/{len(todo)}] {result['key']}: {result['steps_per_s']:.1f} steps/s, "
+                f"setup {result['setup_s']:.2f}s, p99 {result['step_ms_p99']:.1f}ms, "
+                f"{result['peak_mb']:.0f}MB"
+            )
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "steps": steps,
+        "fixed_params": fixed_params,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved {out}")
+
+
+def compare(old, new, threshold=0.1):
+    """
+    Print every case that got more than `threshold` slower (steps/s, setup) or bigger (peak memory).
+    Returns the number of regressions.
+    """
+    with open(old) as f:
+        before = {r["key"]: r for r in json.load(f)["results"]}
+    with open(new) as f:
+        after = {r["key"]: r for r in json.load(f)["results"]}
+
+    regressions = 0
+    for key in sorted(before.keys() & after.keys()):
+        a, b = before[key], after[key]
+        checks = [
+            ("steps/s", a["steps_per_s"] / b["steps_per_s"] - 1),
+            ("setup", b["setup_s"] / a["setup_s"] - 1),
+            ("peak memory", b["peak_mb"] / a["peak_mb"] - 1),
+        ]
+        speedup = b["steps_per_s"] / a["steps_per_s"]
+        flags = [
+            f"{name} {change:+.0%}" for name, change in checks if change > threshold
+        ]
+        regressions += bool(flags)
+        status = "REGRESSION " + ", ".join(flags) if flags else "ok"
+        print(f"{key}: {speedup:.2f}x steps/s, {status}")
+    for key in sorted(before.keys() ^ after.keys()):
+        print(f"{key}: only in {'old' if key in before else 'new'}")
+    return regressions
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser("Protesters Vs Police benchmarks")
+    sub = ap.add_subparsers(dest="command", required=True)
+    ap_run = sub.add_parser("run", help="time the benchmark matrix")
+    ap_run.add_argument("--out", default="benchmarks/results.json")
+    ap_run.add_argument("--quick", action="store_true", help="small matrix")
+    ap_run.add_argument("--steps", type=int, default=steps)
+    ap_cmp = sub.add_parser("compare", help="flag regressions between two result files")
+    ap_cmp.add_argument("old")
+    ap_cmp.add_argument("new")
+    ap_cmp.add_argument("--threshold", type=float, default=0.1)
+    ags = ap.parse_args()
+
+    if ags.command == "run":
+        run(ags.out, ags.quick, ags.steps)
+    else:
+        sys.exit(1 if compare(ags.old, ags.new, ags.threshold) else 0)
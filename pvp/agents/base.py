@@ -0,0 +1,41 @@
+class Agent:
+    """
+    Slotted stand-in for mesa's Agent, with the same unique_id, model, pos and random.
+    Agents have no __dict__: every field is a slot, so subclasses list theirs in __slots__.
+    """
+
+    __slots__ = ("unique_id", "model", "pos")
+
+    def __init__(self, unique_id, model):
+        self.unique_id = unique_id
+        self.model = model
+        self.pos = None
+
+    def step(self):
+        pass
+
+    def advance(self):
+        pass
+
+    @property
+    def random(self):
+        return self.model.random
+
+    def look_around(self):
+        """
+        The agents on the neighboring cells and the empty neighboring cells
+        """
+        cells = self.model.grid.grid
+        neighbors, empty_neighbors = [], []
+        for x, y in self.model.neighborhoods[self.pos]:
+            if cells[x][y] is None:
+                empty_neighbors.append((x, y))
+            else:
+                neighbors.append(cells[x][y])
+        return neighbors, empty_neighbors
+
+    def empty_neighbors(self):
+        cells = self.model.grid.grid
+        return [
+            (x, y) for x, y in self.model.neighborhoods[self.pos] if cells[x][y] is None
+        ]
@@ -1,4 +1,4 @@
-from mesa import Agent
+from .base import Agent
 
 
 class Block(Agent):
@@ -6,6 +6,11 @@ class Block(Agent):
     Using Block as an agent instead. Allows for flexibility and can be easily tied in to further strategies without changing much
     """
 
+    __slots__ = ()
+    breed = "Block"
+    jail_sentence = None
+    condition = "Quiescent"
+
     def __init__(
         self,
         unique_id,
@@ -14,9 +19,6 @@ class Block(Agent):
     ):
         super().__init__(unique_id, model)
         self.pos = pos
-        self.breed = "Block"
-        self.jail_sentence = None
-        self.condition = "Quiescent"
 
     def step(self):
         """
@@ -1,10 +1,24 @@
 import math
-import random
 
-from mesa import Agent
+from .base import Agent
 
 
 class Citizen(Agent):
+    __slots__ = (
+        "counted",
+        "looked",
+        "_condition",
+        "_jail_sentence",
+        "risk_aversion",
+        "threshold",
+        "direction_bias",
+        "vision",
+        "steps_active",
+        "arrest_probability",
+        "aggression",
+    )
+    breed = "citizen"
+
     def __init__(
         self,
         unique_id,
@@ -18,7 +32,10 @@ class Citizen(Agent):
     ):
 
         super().__init__(unique_id, model)
-        self.breed = "citizen"
+        self.counted = False  # set while the model census keeps track of this citizen
+        self.looked = -1  # grid clock when the neighbors were last looked at
+        self._condition = "Quiescent"
+        self._jail_sentence = False
         self.pos = pos
         self.risk_aversion = risk_aversion
         self.threshold = threshold
@@ -30,137 +47,113 @@ class Citizen(Agent):
         self.arrest_probability = None
         self.aggression = aggression
 
+    @property
+    def condition(self):
+        return self._condition
+
+    @condition.setter
+    def condition(self, value):
+        if value != self._condition and self.counted:
+            self.model.census.condition_changed(self, self._condition, value)
+        if value != self._condition and self.pos is not None:
+            self.model.grid.touch(self.pos)
+        self._condition = value
+
+    @property
+    def jail_sentence(self):
+        return self._jail_sentence
+
+    @jail_sentence.setter
+    def jail_sentence(self, value):
+        if value != self._jail_sentence and self.counted:
+            self.model.census.jail_changed(self, self._jail_sentence, value)
+        if value != self._jail_sentence and self.pos is not None:
+            self.model.grid.touch(self.pos)
+        self._jail_sentence = value
+
     def step(self):
         """
         Decide whether to activate, then move if applicable.
+        The arrest probability is only worked out again when something changed around me.
         """
 
         if self.risk_aversion < 0.05:
             self.condition = "Deviant"
 
-        self.update_neighbors()
-        self.update_estimated_arrest_probability()
+        grid = self.model.grid
+        empty_neighbors = None
+        if grid.changed_since(self.pos, self.looked):
+            neighbors, empty_neighbors = self.look_around()
+            self.arrest_probability = self.estimate_arrest_probability(neighbors)
         self.update_aggression_threshold_after_arrest()
-
-        net_risk = self.risk_aversion * self.arrest_probability
-        if (
-            self.condition == "Quiescent"
-            and abs(net_risk - self.arrest_probability) > self.threshold
-        ):
-            self.condition = "Active"
-        elif (
-            self.condition == "Active"
-            and abs(net_risk - self.arrest_probability) <= self.threshold
-        ):
-            self.condition = "Quiescent"
-        elif (
-            self.condition == "Deviant"
-            and abs(net_risk - self.arrest_probability) <= self.threshold
-        ):
-            self.condition = "Quiescent"
-
-        if self.model.movement and self.empty_neighbors:
-            if self.direction_bias != "Random":
-
-                if len(self.empty_neighbors) > 0:
-                    move = self.choose_direction(self.empty_neighbors)
+        self.condition = self.next_condition(
+            self.condition, self.arrest_probability, self.threshold
+        )
+        # my own flip doesn't change what I see, only a move does
+        self.looked = grid.clock
+
+        if self.model.movement:
+            if empty_neighbors is None:
+                empty_neighbors = self.empty_neighbors()
+            if empty_neighbors:
+                if self.direction_bias != "Random":
+                    move = self.choose_direction(empty_neighbors)
                     if move is not None:
                         self.model.grid.move_agent(self, move)
-            else:
-                new_pos = self.random.choice(self.empty_neighbors)
-                self.model.grid.move_agent(self, new_pos)
+                else:
+                    new_pos = self.random.choice(empty_neighbors)
+                    self.model.grid.move_agent(self, new_pos)
 
         if self.condition == "Active" or self.condition == "Deviant":
             self.steps_active += 1
         elif self.condition == "Quiescent":
             self.steps_active = 0
 
-    def calc_direction(self, new_pos):
-        if new_pos[1] < self.pos[1] and new_pos[0] == self.pos[0]:
-            return "up"
-        elif new_pos[1] > self.pos[1] and new_pos[0] == self.pos[0]:
-            return "down"
-        elif new_pos[1] == self.pos[1] and new_pos[0] > self.pos[0]:
-            return "right"
-        elif new_pos[1] == self.pos[1] and new_pos[0] < self.pos[0]:
-            return "left"
-        else:
-            return None
+    def next_condition(self, condition, arrest_probability, threshold):
+        net_risk = self.risk_aversion * arrest_probability
+        if condition == "Quiescent" and abs(net_risk - arrest_probability) > threshold:
+            return "Active"
+        elif condition == "Active" and abs(net_risk - arrest_probability) <= threshold:
+            return "Quiescent"
+        elif condition == "Deviant" and abs(net_risk - arrest_probability) <= threshold:
+            return "Quiescent"
+        return condition
 
     def choose_direction(self, possible_moves):
-        choices = []
-        x_left = (self.model.width / 2) - 5
-        y_up = (self.model.height / 2) - 5
-        x_right = self.model.width - x_left
-        y_down = self.model.height - y_up
-
-        if (
-            self.direction_bias == "Clockwise"
-            or self.direction_bias == "Anti-clockwise"
-        ):
-            for x in possible_moves:
-                direction = self.calc_direction(x)
-                if self.pos[0] < x_left and self.pos[1] > y_up:
-                    if self.direction_bias == "Anti-clockwise" and direction == "up":
-                        choices.append(x)
-                    elif self.direction_bias == "Clockwise" and direction == "down":
-                        choices.append(x)
-                if self.pos[0] < x_right and self.pos[1] < y_up:
-                    if self.direction_bias == "Anti-clockwise" and direction == "right":
-                        choices.append(x)
-                    elif self.direction_bias == "Clockwise" and direction == "left":
-                        choices.append(x)
-                if self.pos[0] > x_right and self.pos[1] < y_down:
-                    if self.direction_bias == "Anti-clockwise" and direction == "down":
-                        choices.append(x)
-                    elif self.direction_bias == "Clockwise" and direction == "up":
-                        choices.append(x)
-                if self.pos[0] > x_left and self.pos[1] > y_down:
-                    if self.direction_bias == "Anti-clockwise" and direction == "left":
-                        choices.append(x)
-                    elif self.direction_bias == "Clockwise" and direction == "right":
-                        choices.append(x)
-        else:
-            choices = [
-                x
-                for x in possible_moves
-                if self.calc_direction(x) == self.direction_bias
-            ]
+        choices = self.preferred_moves(possible_moves)
         if len(choices) != 0:
-            return random.choice(choices)
+            return self.random.choice(choices)
         else:
             return self.random.choice(possible_moves)
 
-    def update_neighbors(self):
-
-        self.neighborhood = self.model.grid.get_neighborhood(
-            self.pos, moore=False, radius=1
-        )
-        self.neighbors = self.model.grid.get_cell_list_contents(self.neighborhood)
-        self.empty_neighbors = [
-            c for c in self.neighborhood if self.model.grid.is_cell_empty(c)
-        ]
+    def preferred_moves(self, possible_moves):
+        """
+        The moves that follow direction_bias, may be empty. Looked up in the model's flow field
+        """
+        preferred = self.model.flow[self.pos]
+        if not preferred:
+            return []
+        return [move for move in possible_moves if move in preferred]
 
-    def update_estimated_arrest_probability(self):
+    def estimate_arrest_probability(self, neighbors):
 
-        cops_in_vision = len([c for c in self.neighbors if c.breed == "cop"])
+        cops_in_vision = len([c for c in neighbors if c.breed == "cop"])
         actives_in_vision = 1.0
-        for c in self.neighbors:
+        for c in neighbors:
             if c.breed == "citizen" and c.condition == "Active" and not c.jail_sentence:
                 actives_in_vision += 1
-        self.arrest_probability = 1 - math.exp(
+        return 1 - math.exp(
             -1 * self.model.arrest_prob_constant * (cops_in_vision / actives_in_vision)
         )
 
     def update_aggression_threshold_after_arrest(self):
+        """
+        Halve the threshold if an arrested Deviant is in vision, looked up in the model's per step count
+        """
+        self.threshold = self.threshold_after_arrest()
 
-        neighbors = self.model.grid.get_cell_list_contents(
-            self.model.grid.get_neighborhood(self.pos, moore=False, radius=self.vision)
-        )
-
-        arrestees_in_vision = 0
-        for c in neighbors:
-            if c.breed == "citizen" and c.condition == "Deviant" and c.jail_sentence:
-                arrestees_in_vision += 1
-        if arrestees_in_vision > 0:
-            self.threshold /= 2
+    def threshold_after_arrest(self):
+        x, y = self.pos
+        if self.model.jailed_deviants[x, y] > 0:
+            return self.threshold / 2
+        return self.threshold
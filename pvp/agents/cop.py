@@ -1,18 +1,29 @@
-import random
-
-from mesa import Agent
+from .base import Agent
 
 
 class Cop(Agent):
+    __slots__ = (
+        "vision",
+        "can_arrest",
+        "arrested_step",
+        "wait_for",
+        "looked",
+        "cops_near",
+        "rebels_near",
+    )
+    breed = "cop"
+
     def __init__(self, unique_id, model, pos, vision):
 
         super().__init__(unique_id, model)
-        self.breed = "cop"
         self.pos = pos
         self.vision = vision
         self.can_arrest = True
         self.arrested_step = 0
         self.wait_for = 0  # no of steps to wait before arresting someone else
+        self.looked = -1  # grid clock when the neighbors were last counted
+        self.cops_near = 0
+        self.rebels_near = 0  # Active or Deviant citizens in vision, not arrested
 
     def step(self):
         """
@@ -25,111 +36,88 @@ class Cop(Agent):
         else:
             self.wait_for -= 1
 
-        self.update_neighbors()
-        active_neighbors, deviant_neighbors, cop_neighbors = [], [], []
-        for agent in self.neighbors:
-            if (
-                agent.breed == "citizen"
-                and agent.condition == "Active"
-                and not agent.jail_sentence
-            ):
-                active_neighbors.append(agent)
+        if self.can_arrest and self.model.jail.has_room():
+            self.arrest()
+
+        if self.model.movement and self.can_arrest:
+            empty_neighbors = self.empty_neighbors()
+            if empty_neighbors:
+                useful_move = self.move_towards_actives(empty_neighbors)
+                if useful_move:
+                    self.model.grid.move_agent(self, useful_move)
+                else:
+                    self.model.grid.move_agent(
+                        self, self.random.choice(empty_neighbors)
+                    )
+
+    def arrest(self):
+        """
+        Arrest a random Deviant in vision (or Active, if there is no Deviant) who has been one for 3 steps,
+        if another cop is around. Who is around is only counted again when something changed around me.
+        """
+        grid = self.model.grid
+        neighbors = None
+        if grid.changed_since(self.pos, self.looked):
+            neighbors, _ = self.look_around()
+            self.count_neighbors(neighbors)
+            self.looked = grid.clock
+        if self.cops_near <= 1 or not self.rebels_near:
+            return
+        if neighbors is None:
+            neighbors, _ = self.look_around()
+
+        active_neighbors, deviant_neighbors = [], []
+        for agent in neighbors:
+            if agent.breed == "citizen" and not agent.jail_sentence:
+                if agent.condition == "Active":
+                    active_neighbors.append(agent)
+                elif agent.condition == "Deviant":
+                    deviant_neighbors.append(agent)
+
+        arrestee = None
+        if deviant_neighbors:
+            possibles = []
+            for agent in deviant_neighbors:
+                if agent.steps_active >= 3:
+                    possibles.append(agent)
+            arrestee = self.random.choice(possibles) if possibles else None
+        elif active_neighbors:
+            possibles = []
+            for agent in active_neighbors:
+                if agent.steps_active >= 3:
+                    possibles.append(agent)
+            arrestee = self.random.choice(possibles) if possibles else None
+        if arrestee:
+            self.model.jail.arrest(arrestee)
+            self.can_arrest = False
+            self.wait_for = 15
+
+    def count_neighbors(self, neighbors):
+        self.cops_near = self.rebels_near = 0
+        for agent in neighbors:
             if agent.breed == "cop":
-                cop_neighbors.append(agent)
-            if (
+                self.cops_near += 1
+            elif (
                 agent.breed == "citizen"
-                and agent.condition == "Deviant"
+                and agent.condition != "Quiescent"
                 and not agent.jail_sentence
             ):
-                deviant_neighbors.append(agent)
-
-        if (
-            self.can_arrest
-            and self.model.jail_capacity > len(self.model.jailed_agents)
-            and len(cop_neighbors) > 1
-        ):
-            arrestee = None
-            if deviant_neighbors:
-                possibles = []
-                for agent in deviant_neighbors:
-                    if agent.steps_active >= 3:
-                        possibles.append(agent)
-                arrestee = self.random.choice(possibles) if possibles else None
-            elif active_neighbors:
-                possibles = []
-                for agent in active_neighbors:
-                    if agent.steps_active >= 3:
-                        possibles.append(agent)
-                arrestee = self.random.choice(possibles) if possibles else None
-            if arrestee:
-                arrestee.jail_sentence = True
-                self.model.arrested_agents.append(arrestee)
-                self.can_arrest = False
-                self.wait_for = 15
-
-        if self.model.movement and self.empty_neighbors and self.can_arrest:
-            useful_move = self.move_towards_actives()
-            if useful_move:
-                self.model.grid.move_agent(self, useful_move)
-            else:
-                self.model.grid.move_agent(
-                    self, self.random.choice(self.empty_neighbors)
-                )
-
-    def move_towards_actives(self):
-        neighborhood = self.model.grid.get_neighborhood(
-            self.pos, moore=False, radius=self.vision
-        )
-        deviants, actives = [], []
-        for x in neighborhood:
-            neighbor = self.model.grid.get_cell_list_contents(x)
-            if neighbor and neighbor[0].breed == "citizen":
-                if neighbor[0].condition == "Deviant":
-                    deviants.append(x)
-                if neighbor[0].condition == "Active":
-                    actives.append(x)
-        if deviants:
-            toward = random.choice(deviants)
-        elif actives:
-            toward = random.choice(actives)
-        else:
-            return None
-        dict = {
-            "left": (self.pos[0] - 1, self.pos[1]),
-            "right": (self.pos[0] + 1, self.pos[1]),
-            "up": (self.pos[0], self.pos[1] - 1),
-            "down": (self.pos[0], self.pos[1] + 1),
-        }
-        new_pos = []
+                self.rebels_near += 1
 
-        if toward:
-            if toward[0] > self.pos[0] and self.model.grid.is_cell_empty(
-                dict["right"]
-            ):  # citizen is more right than cop
-                new_pos.append("right")
-            elif toward[0] < self.pos[0] and self.model.grid.is_cell_empty(
-                dict["left"]
-            ):  # citizen is more left than cop
-                new_pos.append("left")
-            if toward[1] > self.pos[1] and self.model.grid.is_cell_empty(
-                dict["down"]
-            ):  # citizen is further down than cop
-                new_pos.append("down")
-            elif toward[1] < self.pos[1] and self.model.grid.is_cell_empty(
-                dict["up"]
-            ):  # citizen is further up than cop
-                new_pos.append("up")
-        new_pos = dict[random.choice(new_pos)] if new_pos else None
-        return new_pos
+    def rest(self):
+        """
+        Count down the arrest cooldown. This is all a step does while wait_for > 0 and the cop can't arrest.
+        """
+        self.wait_for -= 1
 
-    def update_neighbors(self):
+    def move_towards_actives(self, empty_neighbors):
         """
-        Look around and see who my neighbors are.
+        Step towards the closest Deviant in vision (or Active, if there is no Deviant),
+        reading the direction off the model's per step pursuit field.
         """
-        self.neighborhood = self.model.grid.get_neighborhood(
-            self.pos, moore=False, radius=1
-        )
-        self.neighbors = self.model.grid.get_cell_list_contents(self.neighborhood)
-        self.empty_neighbors = [
-            c for c in self.neighborhood if self.model.grid.is_cell_empty(c)
-        ]
+        field = self.model.pursuit
+        here = field[self.pos]
+        if here > self.vision:
+            return None
+        closer = [c for c in empty_neighbors if field[c] < here]
+        return self.random.choice(closer) if closer else None
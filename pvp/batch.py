@@ -0,0 +1,235 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from .ensemble import ensemble_params, run_ensemble
+from .model import ProtestersVsPolice
+
+REPORTERS = ["Quiescent", "Active", "Deviant", "Jailed"]
+
+
+def expand(fixed, variable=None):
+    """
+    All parameter sets made from the fixed parameters and every combination of the variable ones
+    eg. expand({"height": 40}, {"ratio": [0.5, 0.8], "wrap": ["Wrap around", "Don't wrap around"]}) gives 4 sets
+    """
+    variable = variable or {}
+    names = list(variable)
+    return [
+        {**fixed, **dict(zip(names, values))}
+        for values in itertools.product(*(variable[n] for n in names))
+    ]
+
+
+def make_jobs(param_sets, replicates=1, seed=0):
+    """
+    One (run, params, seed) job per parameter set and replicate.
+    Replicate i of every parameter set gets seed + i, so the jobs don't depend on how they are spread over workers.
+    """
+    if isinstance(param_sets, dict):
+        param_sets = [param_sets]
+    jobs = []
+    for params in param_sets:
+        for i in range(replicates):
+            jobs.append((len(jobs), dict(params), seed + i))
+    return jobs
+
+
+def run_job(job, max_steps, cache=None):
+    """
+    Run one model to max_steps (or until it stops itself, eg. when it converged) and return its reporter series
+    and final counts. With a cache (see cache.ResultCache) a run that was done before is read back instead.
+    """
+    run, params, seed = job
+    found = cached(job, max_steps, cache)
+    if found:
+        return found[0]
+    model = new_model(params, seed)
+    while model.running and model.iteration < max_steps:
+        model.step()
+    model.write_log()
+    result = summarize(model, run, params, seed)
+    store(result, max_steps, cache)
+    return result
+
+
+def new_model(params, seed):
+    """
+    The model of a job. Agent level data is never read from a batch run, and the
+    experiments/ log is only written when the parameters ask for it with log_every
+    """
+    return ProtestersVsPolice(
+        **{"log_every": None, **params, "record_every": None}, seed=seed
+    )
+
+
+def summarize(model, run, params, seed):
+    """
+    The result of a finished run: its reporter series and final counts
+    """
+    series = {name: list(model.datacollector.model_vars[name]) for name in REPORTERS}
+    return {
+        "run": run,
+        "seed": seed,
+        "params": params,
+        "converged_at": model.converged_at,
+        "first_step": model.datacollector.first_step,
+        "series": series,
+        "final": {name: values[-1] for name, values in series.items()},
+    }
+
+
+def make_ensemble_jobs(param_sets, replicates=1, seed=0):
+    """
+    One (first run, params, seed, replicates) job per parameter set, numbered like make_jobs
+    """
+    if isinstance(param_sets, dict):
+        param_sets = [param_sets]
+    return [
+        (i * replicates, dict(params), seed, replicates)
+        for i, params in enumerate(param_sets)
+    ]
+
+
+def run_ensemble_job(job, max_steps, cache=None):
+    """
+    Run all replicates of one parameter set together on the array engine (see ensemble.EnsembleEngine),
+    one result per replicate like run_job. They are read from the cache only if all of them are in it.
+    """
+    run, params, seed, replicates = job
+    found = cached(job, max_steps, cache)
+    if found:
+        return found
+    results = []
+    for i, result in enumerate(run_ensemble(params, replicates, max_steps, seed)):
+        result = {"run": run + i, "params": params, "first_step": 0, **result}
+        result["final"] = {
+            name: values[-1] for name, values in result["series"].items()
+        }
+        store(result, max_steps, cache, ensemble_params(params))
+        results.append(result)
+    return results
+
+
+def cached(job, max_steps, cache):
+    """
+    The results of all the runs of a job from the cache, None if the cache is off or misses one of them
+    """
+    if cache is None:
+        return None
+    if len(job) == 3:
+        run, params, seed = job
+        runs = [(run, params, params, seed)]
+    else:
+        # keyed by what the replicates ran with, so they never pass for agents engine runs
+        run, params, seed, replicates = job
+        runs = [
+            (run + i, params, ensemble_params(params), seed + i)
+            for i in range(replicates)
+        ]
+    found = []
+    for run, params, keyed, seed in runs:
+        result = cache.get(cache.key(keyed, seed, max_steps))
+        if result is None:
+            return None
+        found.append({**result, "run": run, "params": params})
+    return found
+
+
+def store(result, max_steps, cache, params=None):
+    """
+    Put a result in the cache, keyed by params (the result's own if not given)
+    """
+    if cache is not None:
+        stored = {k: v for k, v in result.items() if k not in ("run", "params")}
+        params = result["params"] if params is None else params
+        cache.put(cache.key(params, result["seed"], max_steps), stored)
+
+
+def iter_batch(
+    param_sets,
+    replicates=1,
+    max_steps=500,
+    seed=0,
+    workers=None,
+    ensemble=False,
+    cache=None,
+):
+    """
+    Run the jobs on a pool of worker processes and yield every result as soon as its run finishes.
+    With ensemble, the replicates of a parameter set run together as one job, on the array engine.
+    With a cache (see cache.ResultCache), runs done before come straight from it and new ones are added.
+    """
+    if ensemble:
+        jobs, run = make_ensemble_jobs(param_sets, replicates, seed), run_ensemble_job
+    else:
+        jobs, run = make_jobs(param_sets, replicates, seed), run_job
+    todo = []
+    for job in jobs:
+        found = cached(job, max_steps, cache)
+        if found:
+            yield from found
+        else:
+            todo.append(job)
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        for job in todo:
+            yield from results(run(job, max_steps, cache))
+        return
+    if not todo:
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run, job, max_steps, cache) for job in todo]
+        for future in as_completed(futures):
+            yield from results(future.result())
+
+
+def results(result):
+    return result if isinstance(result, list) else [result]
+
+
+def to_frame(result):
+    """
+    Tidy table of one run: one row per step with the run, seed and parameters as columns
+    """
+    df = pd.DataFrame(result["series"])
+    df.insert(0, "step", range(result["first_step"], result["first_step"] + len(df)))
+    df.insert(0, "converged_at", result["converged_at"])
+    df.insert(0, "seed", result["seed"])
+    df.insert(0, "run", result["run"])
+    for name, value in result["params"].items():
+        df[name] = value
+    return df
+
+
+def run_batch(
+    param_sets,
+    replicates=1,
+    max_steps=500,
+    seed=0,
+    workers=None,
+    ensemble=False,
+    cache=None,
+):
+    """
+    Run every parameter set `replicates` times in parallel.
+    Returns a tidy table with one row per run and step, the final counts are the last step of every run (see final).
+    """
+    frames = [
+        to_frame(result)
+        for result in iter_batch(
+            param_sets, replicates, max_steps, seed, workers, ensemble, cache
+        )
+    ]
+    return pd.concat(frames, ignore_index=True).sort_values(
+        ["run", "step"], ignore_index=True
+    )
+
+
+def final(df):
+    """
+    Last step of every run in a run_batch table
+    """
+    return df.groupby("run").tail(1).reset_index(drop=True)
@@ -0,0 +1,135 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+
+from .model import ProtestersVsPolice
+
+# parameters that only change what a run writes or times, not its reporters
+IGNORED = (
+    "run_id",
+    "log_every",
+    "record_every",
+    "record_breeds",
+    "record_fields",
+    "profile",
+    "funmode",
+)
+
+
+@functools.lru_cache(maxsize=None)
+def defaults():
+    signature = inspect.signature(ProtestersVsPolice.__init__)
+    return {
+        name: p.default
+        for name, p in signature.parameters.items()
+        if name not in ("self", "seed", "state")
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """
+    Hash of the source of the pvp package, so results of older model code are never reused
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for directory, dirs, files in sorted(os.walk(root)):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(".py"):
+                path = os.path.join(directory, name)
+                digest.update(os.path.relpath(path, root).encode())
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Results of finished runs on disk (see batch.run_job), one JSON file per run, named after a hash of everything
+    the run depends on: all its parameters (defaults filled in), the seed, max_steps and the model code version.
+    Reading an entry marks it as used, and once the files take more than max_bytes the least recently used
+    ones are deleted. Entries are written to a temporary file and renamed into place, so any number of
+    processes can share a cache: a reader sees a whole entry or none.
+    """
+
+    def __init__(self, directory=os.path.join("experiments", "cache"), max_bytes=2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, params, seed, max_steps):
+        full = {**defaults(), **params}
+        for name in IGNORED:
+            full.pop(name, None)
+        text = json.dumps(
+            {
+                "params": full,
+                "seed": seed,
+                "max_steps": max_steps,
+                "code": code_version(),
+            },
+            sort_keys=True,
+            default=repr,
+        )
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """
+        The stored result, None if it is not in the cache
+        """
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+            os.utime(path)  # last used, for the eviction order
+        except (FileNotFoundError, ValueError):
+            return None
+        return result
+
+    def put(self, key, result):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(result, f, default=lambda value: value.item())
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache fits in max_bytes
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:  # evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                os.unlink(entry.path)
@@ -0,0 +1,71 @@
+from collections import Counter
+
+REBELS = ("Active", "Deviant")
+
+
+class Census:
+    """
+    Live head counts of the agents in the schedule, so the reporters don't have to walk every agent each step.
+    Agents are counted from add() until remove(). Citizens report their own condition and jail changes
+    through condition_changed/jail_changed.
+    """
+
+    def __init__(self):
+        self.breeds = Counter()
+        self.conditions = (
+            Counter()
+        )  # non cop agents without a jail sentence, as count_type_citizens counts them
+        self.arrested_conditions = (
+            Counter()
+        )  # the same for arrested agents still on the grid
+        self.arrested = 0  # arrested citizens still on the grid
+        self.rebels = 0  # Active or Deviant citizens, arrested or not
+        self.rebel_aggression = 0.0
+
+    def add(self, agent):
+        self.breeds[agent.breed] += 1
+        if agent.breed == "cop":
+            return
+        self._conditions(agent.jail_sentence)[agent.condition] += 1
+        if agent.breed == "citizen":
+            self.arrested += bool(agent.jail_sentence)
+            self._rebel(agent, agent.condition, 1)
+            agent.counted = True
+
+    def remove(self, agent):
+        self.breeds[agent.breed] -= 1
+        if agent.breed == "cop":
+            return
+        self._conditions(agent.jail_sentence)[agent.condition] -= 1
+        if agent.breed == "citizen":
+            self.arrested -= bool(agent.jail_sentence)
+            self._rebel(agent, agent.condition, -1)
+            agent.counted = False
+
+    def condition_changed(self, agent, old, new):
+        counts = self._conditions(agent.jail_sentence)
+        counts[old] -= 1
+        counts[new] += 1
+        self._rebel(agent, old, -1)
+        self._rebel(agent, new, 1)
+
+    def jail_changed(self, agent, old, new):
+        self._conditions(old)[agent.condition] -= 1
+        self._conditions(new)[agent.condition] += 1
+        self.arrested += bool(new) - bool(old)
+
+    def avg_aggression(self):
+        """
+        Average aggression of the Active and Deviant citizens (nan if there are none)
+        """
+        if self.rebels == 0:
+            return float("nan")
+        return self.rebel_aggression / self.rebels
+
+    def _conditions(self, jail_sentence):
+        return self.arrested_conditions if jail_sentence else self.conditions
+
+    def _rebel(self, agent, condition, sign):
+        if condition in REBELS:
+            self.rebels += sign
+            self.rebel_aggression += sign * agent.aggression
@@ -0,0 +1,349 @@
+import pickle
+import zlib
+
+import numpy as np
+
+from .agents.block import Block
+from .agents.citizen import Citizen
+from .agents.cop import Cop
+from .datacollection import Window
+from .engine import CONDITIONS, COP
+from .engine import FIELDS as ENGINE_FIELDS
+from .engine import ArrayEngine
+from .kernel import AVAILABLE as KERNEL_AVAILABLE
+from .kernel import FIELDS as KERNEL_FIELDS
+from .kernel import NOW as KERNEL_NOW
+from .kernel import SequentialEngine
+
+VERSION = 2
+
+# parameters a snapshot can't be restored with a different value of
+FIXED = (
+    "height",
+    "width",
+    "environment",
+    "wrap",
+    "engine",
+    "collect_window",
+    "profile",
+)
+
+
+def snapshot(model):
+    """
+    The complete state of a model as compressed bytes: parameters, random generator, agents and their
+    fields (grid occupancy is their positions), scheduler order, jail, census and collected reporters.
+    Agent level recordings (AgentRecorder) and profiler times are not part of it.
+    """
+    state = {
+        "version": VERSION,
+        "params": model.params,
+        "run_id": model.run_id,
+        "random": model.random.getstate(),
+        "model": {
+            "iteration": model.iteration,
+            "aggression": model.aggression,
+            "avg_agg": model.avg_agg,
+            "unique_id": model.unique_id,
+            "running": model.running,
+            "converged_at": model.converged_at,
+            "arrested_deviants": list(model.arrested_deviants),
+            "steps": model.schedule.steps,
+            "time": model.schedule.time,
+        },
+        "collector": save_collector(model),
+        "written": model.writer.written,
+        "convergence": list(model.convergence.rows) if model.convergence else None,
+    }
+    if model.array_engine is not None:
+        state["engine"] = save_engine(model.array_engine)
+    else:
+        state["agents"] = save_agents(model)
+    return zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def restore(data, **changes):
+    """
+    Rebuild the model of a snapshot, with some parameters changed if given (eg. jail_capacity=10).
+    Restored without changes, the model carries on exactly like the original would have.
+    A new `seed` reseeds the random generator, so forks of one snapshot can diverge.
+    max_jail_term can be shortened or dropped, but not set on a snapshot taken without one.
+    """
+    from .model import ProtestersVsPolice
+
+    state = pickle.loads(zlib.decompress(data))
+    if state["version"] != VERSION:
+        raise ValueError(f"snapshot version {state['version']}, expected {VERSION}")
+    for name in FIXED:
+        if name in changes and changes[name] != state["params"][name]:
+            raise ValueError(f"{name} can't be changed when restoring a snapshot")
+    # without a term the jail keeps no sentences (only a count on the agents engines),
+    # so there is nothing to release the inmates by
+    if state["params"]["max_jail_term"] is None and changes.get("max_jail_term"):
+        raise ValueError(
+            "max_jail_term can't be set when restoring a snapshot taken without one"
+        )
+
+    params = {**state["params"], **changes}
+    params["run_id"] = changes.get("run_id") or state["run_id"]
+    return ProtestersVsPolice(**params, state=state)
+
+
+def fork(data, variants):
+    """
+    One model per dict of parameter changes in variants, all starting from the same snapshot.
+    Every fork gets its own run_id unless the variant gives one.
+    """
+    import uuid
+
+    return [
+        restore(data, **{"run_id": uuid.uuid4().hex, **changes}) for changes in variants
+    ]
+
+
+def save(model, path):
+    with open(path, "wb") as f:
+        f.write(snapshot(model))
+
+
+def load(path, **changes):
+    with open(path, "rb") as f:
+        return restore(f.read(), **changes)
+
+
+def save_agents(model):
+    """
+    Agent fields as columns per breed. Citizens serving a sentence are off the grid and out of the schedule,
+    they are kept with the jail. Vision and direction bias come from the model parameters.
+    """
+    jail = model.jail
+    inmates = [a for slot in jail.wheel or [] for a in slot]
+    citizens = model.schedule.breed_agents("citizen") + inmates
+    cops = model.schedule.breed_agents("cop")
+    blocks = model.schedule.breed_agents("Block")
+
+    def positions(agents):
+        return np.array(
+            [a.pos if a.pos is not None else (-1, -1) for a in agents], dtype=np.int32
+        ).reshape(-1, 2)
+
+    return {
+        "order": [a.unique_id for a in model.schedule.agents],
+        "citizens": {
+            "unique_id": np.array([a.unique_id for a in citizens], dtype=np.int64),
+            "pos": positions(citizens),
+            "risk_aversion": np.array([a.risk_aversion for a in citizens]),
+            "threshold": np.array([a.threshold for a in citizens]),
+            "aggression": np.array([a.aggression for a in citizens]),
+            "condition": np.array(
+                [CONDITIONS.index(a.condition) for a in citizens], dtype=np.int8
+            ),
+            "jail_sentence": np.array([a.jail_sentence for a in citizens], dtype=bool),
+            "steps_active": np.array(
+                [a.steps_active for a in citizens], dtype=np.int64
+            ),
+            "arrest_probability": np.array(
+                [
+                    np.nan if a.arrest_probability is None else a.arrest_probability
+                    for a in citizens
+                ]
+            ),
+        },
+        "cops": {
+            "unique_id": np.array([a.unique_id for a in cops], dtype=np.int64),
+            "pos": positions(cops),
+            "can_arrest": np.array([a.can_arrest for a in cops], dtype=bool),
+            "arrested_step": np.array([a.arrested_step for a in cops], dtype=np.int64),
+            "wait_for": np.array([a.wait_for for a in cops], dtype=np.int64),
+        },
+        "blocks": {
+            "unique_id": np.array([a.unique_id for a in blocks], dtype=np.int64),
+            "pos": positions(blocks),
+        },
+        "jail": {
+            "pending": [a.unique_id for a in jail.pending],
+            "inmates": jail.inmates,
+            "now": jail.now,
+            # release step of every citizen in the timing wheel
+            "release": {
+                a.unique_id: jail.now + (i - jail.now) % len(jail.wheel)
+                for i, slot in enumerate(jail.wheel or [])
+                for a in slot
+            },
+        },
+        "census": {
+            "breeds": dict(model.census.breeds),
+            "conditions": dict(model.census.conditions),
+            "arrested_conditions": dict(model.census.arrested_conditions),
+            "arrested": model.census.arrested,
+            "rebels": model.census.rebels,
+            "rebel_aggression": model.census.rebel_aggression,
+        },
+    }
+
+
+def load_agents(model, state):
+    """
+    Create the agents of a snapshot and put them back on the grid, in the schedule, census and jail.
+    Called by ProtestersVsPolice instead of spawning a new environment.
+    """
+    if "engine" in state:
+        load_engine(model, state["engine"])
+        return
+    saved = state["agents"]
+    agents = {}
+
+    c = saved["citizens"]
+    for i, uid in enumerate(c["unique_id"].tolist()):
+        agent = Citizen(
+            uid,
+            model,
+            None,
+            risk_aversion=float(c["risk_aversion"][i]),
+            threshold=float(c["threshold"][i]),
+            vision=model.citizen_vision,
+            aggression=float(c["aggression"][i]),
+            direction_bias=model.direction_bias,
+        )
+        agent._condition = CONDITIONS[c["condition"][i]]
+        agent._jail_sentence = bool(c["jail_sentence"][i])
+        agent.steps_active = int(c["steps_active"][i])
+        p = float(c["arrest_probability"][i])
+        agent.arrest_probability = None if np.isnan(p) else p
+        agents[uid] = agent, c["pos"][i]
+
+    c = saved["cops"]
+    for i, uid in enumerate(c["unique_id"].tolist()):
+        agent = Cop(uid, model, None, vision=model.cop_vision)
+        agent.can_arrest = bool(c["can_arrest"][i])
+        agent.arrested_step = int(c["arrested_step"][i])
+        agent.wait_for = int(c["wait_for"][i])
+        agents[uid] = agent, c["pos"][i]
+
+    c = saved["blocks"]
+    for i, uid in enumerate(c["unique_id"].tolist()):
+        agents[uid] = Block(uid, model, None), c["pos"][i]
+
+    for uid in saved["order"]:
+        agent, (x, y) = agents[uid]
+        model.grid.place_agent(agent, (int(x), int(y)))
+        model.schedule.add(agent)
+        if agent.breed == "citizen":
+            agent.counted = True
+
+    census = model.census
+    census.breeds.update(saved["census"]["breeds"])
+    census.conditions.update(saved["census"]["conditions"])
+    census.arrested_conditions.update(saved["census"]["arrested_conditions"])
+    census.arrested = saved["census"]["arrested"]
+    census.rebels = saved["census"]["rebels"]
+    census.rebel_aggression = saved["census"]["rebel_aggression"]
+
+    jail, j = model.jail, saved["jail"]
+    jail.pending.extend(agents[uid][0] for uid in j["pending"])
+    jail.inmates = j["inmates"]
+    jail.now = j["now"]
+    if jail.wheel is not None:
+        for uid, release in j["release"].items():
+            # a shorter max_jail_term cuts the sentences that would now be too long
+            release = min(release, jail.now + jail.max_term)
+            jail.wheel[release % len(jail.wheel)].append(agents[uid][0])
+
+
+def save_engine(engine):
+    if isinstance(engine, SequentialEngine):
+        # its random draws come from model.random, saved with the model
+        return {
+            "kernel": {name: getattr(engine, name).copy() for name in KERNEL_FIELDS}
+        }
+    return {
+        "fields": {name: getattr(engine, name) for name in ENGINE_FIELDS},
+        "inmates": engine.inmates,
+        "arrested_deviants": engine.arrested_deviants,
+        "arrests": engine.arrests,
+        "now": engine.now,
+        "rng": engine.rng.bit_generator.state,
+    }
+
+
+def load_engine(model, saved):
+    if "kernel" in saved:
+        load_kernel(model, saved["kernel"])
+        return
+    fields = saved["fields"]
+    engine = ArrayEngine(model, fields["breed"], fields["risk_aversion"])
+    for name in ENGINE_FIELDS:
+        setattr(engine, name, fields[name].copy())
+    engine.inmates = {k: v.copy() for k, v in saved["inmates"].items()}
+    engine.arrested_deviants = saved["arrested_deviants"].copy()
+    engine.arrests = saved["arrests"]
+    engine.now = saved["now"]
+    engine.rng.bit_generator.state = saved["rng"]
+    model.array_engine = engine
+
+
+def load_kernel(model, fields):
+    if not KERNEL_AVAILABLE:
+        raise RuntimeError('restoring an engine="compiled" snapshot needs numba')
+    empty = np.zeros((model.grid.width, model.grid.height), dtype=np.int8)
+    engine = SequentialEngine(model, empty, empty.astype(float))
+    for name in KERNEL_FIELDS:
+        setattr(engine, name, fields[name].copy())
+    engine.cops = np.flatnonzero(engine.breed == COP)
+    # as in load_agents, a shorter max_jail_term cuts the sentences that would now be too long
+    serving = engine.release >= 0
+    if model.max_jail_term:
+        now = engine.counters[KERNEL_NOW]
+        engine.release[serving] = np.minimum(
+            engine.release[serving], now + model.max_jail_term
+        )
+    else:
+        engine.release[serving] = -1
+    model.array_engine = engine
+
+
+def save_collector(model):
+    collector = model.datacollector
+    return {
+        "model_vars": {
+            name: list(series) for name, series in collector.model_vars.items()
+        },
+        "first_step": collector.first_step,
+        "spilled": collector.spilled,
+    }
+
+
+def load_progress(model, state):
+    """
+    Put back what the model collected and where it was in the run, after the agents
+    """
+    for name, value in state["model"].items():
+        if name in ("steps", "time"):
+            setattr(model.schedule, name, value)
+        else:
+            setattr(model, name, value)
+    model.random.setstate(state["random"])
+    if model.params["seed"] != state["params"]["seed"]:
+        model.random.seed(model.params["seed"])
+        if isinstance(model.array_engine, ArrayEngine):
+            model.array_engine.rng = np.random.default_rng(model.random.getrandbits(64))
+
+    collector, saved = model.datacollector, state["collector"]
+    collector.spilled = saved["spilled"]
+    for name, values in saved["model_vars"].items():
+        series = collector.model_vars[name]
+        if isinstance(series, Window):
+            series.count = saved["first_step"]
+            for value in values:
+                series.append(value)
+        else:
+            series.extend(values)
+
+    if model.run_id == state["run_id"]:
+        model.writer.written = state["written"]
+    if model.convergence is not None and state["convergence"]:
+        model.convergence.rows.extend(state["convergence"])
+    if model.iteration > model.max_iters:
+        model.running = False
+    elif model.converged_at is None:
+        model.running = True
@@ -0,0 +1,32 @@
+from collections import deque
+
+REPORTERS = ("Quiescent", "Active", "Deviant", "Jailed")
+
+
+class ConvergenceDetector:
+    """
+    Decides when a run has settled: the mean of every reporter over the last `window` steps moved
+    less than `tolerance` (relative) from its mean over the window before. Counts keep jittering around
+    a steady state, so the windows are compared instead of single steps. A run where nothing changes at
+    all any more (eg. a full jail and everyone settled) converges after two windows whatever the tolerance.
+    """
+
+    def __init__(self, window, tolerance=0.02, reporters=REPORTERS):
+        self.window = window
+        self.tolerance = tolerance
+        self.reporters = reporters
+        self.rows = deque(maxlen=2 * window)
+
+    def update(self, model_vars):
+        """
+        Take the last collected row of model_vars, True once the run has converged
+        """
+        self.rows.append(tuple(model_vars[name][-1] for name in self.reporters))
+        if len(self.rows) < 2 * self.window:
+            return False
+        rows = list(self.rows)
+        for before, after in zip(zip(*rows[: self.window]), zip(*rows[self.window :])):
+            before, after = sum(before) / self.window, sum(after) / self.window
+            if abs(after - before) > self.tolerance * max(abs(before), 1):
+                return False
+        return True
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+from mesa.datacollection import DataCollector as MesaDataCollector
+
+
+class Window:
+    """
+    The values of one model reporter for the last `size` steps, in a preallocated ring.
+    Reads like the list mesa keeps (len, [-1], slices, iteration), oldest retained step first.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.values = None  # allocated on the first value, with its dtype
+        self.count = 0  # values appended so far, retained or not
+
+    def append(self, value):
+        if self.values is None:
+            self.values = np.empty(self.size, dtype=np.asarray(value).dtype)
+        self.values[self.count % self.size] = value
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def __getitem__(self, i):
+        n = len(self)
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(n))]
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("step not in the retained window")
+        return self.values[(self.count - n + i) % self.size].item()
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_array(self):
+        if self.values is None:
+            return np.empty(0)
+        start = self.count % self.size if self.count > self.size else 0
+        return np.roll(self.values[: len(self)], -start)
+
+
+class DataCollector(MesaDataCollector):
+    """
+    mesa DataCollector that can keep only the last `window` steps of the model reporters, so a run of any
+    length collects in flat memory. window=None keeps everything, like mesa.
+    Just before a step would be dropped, the retained steps that were not handed over yet go to
+    spill(model_vars, first_step), eg. ExperimentWriter.write, so the full series still ends up on disk.
+    """
+
+    def __init__(self, model_reporters=None, window=None, spill=None):
+        self.window = window
+        self.spill = spill
+        self.spilled = 0  # steps handed to spill so far
+        super().__init__(model_reporters=model_reporters)
+
+    def _new_model_reporter(self, name, reporter):
+        super()._new_model_reporter(name, reporter)
+        if self.window:
+            self.model_vars[name] = Window(self.window)
+
+    @property
+    def collected(self):
+        """
+        Steps collected so far, retained or not
+        """
+        series = next(iter(self.model_vars.values()), [])
+        return series.count if isinstance(series, Window) else len(series)
+
+    @property
+    def first_step(self):
+        """
+        Step of the oldest retained row
+        """
+        series = next(iter(self.model_vars.values()), [])
+        return self.collected - len(series)
+
+    def collect(self, model):
+        if (
+            self.window
+            and self.spill is not None
+            and self.collected >= self.window
+            and self.first_step >= self.spilled
+        ):
+            self.spill(self.model_vars, self.first_step)
+            self.spilled = self.collected
+        super().collect(model)
+
+    def get_model_vars_dataframe(self):
+        """
+        The retained steps, indexed by step
+        """
+        if not self.window:
+            return super().get_model_vars_dataframe()
+        index = pd.RangeIndex(self.first_step, self.collected)
+        return pd.DataFrame(
+            {name: series.to_array() for name, series in self.model_vars.items()},
+            index=index,
+        )
@@ -0,0 +1,292 @@
+import numpy as np
+
+from .spatial import OFFSETS, diamond_count, neighbor_count, pursuit_field
+
+EMPTY, CITIZEN, COP, BLOCK = 0, 1, 2, 3
+QUIESCENT, ACTIVE, DEVIANT = 0, 1, 2
+CONDITIONS = ("Quiescent", "Active", "Deviant")
+
+# per cell state, moved together with the agent standing on the cell
+FIELDS = (
+    "breed",
+    "condition",
+    "risk_aversion",
+    "threshold",
+    "steps_active",
+    "jail",
+    "arrest_order",
+    "can_arrest",
+    "wait_for",
+    "arrest_probability",
+)
+
+
+class ArrayEngine:
+    """
+    Steps ProtestersVsPolice on numpy grids instead of Citizen/Cop objects (engine="array").
+    Every agent field lives in a width x height array, so the position of an agent is the cell it is stored in.
+    A step applies the same rules as Citizen.step and Cop.step, but to the whole board at once:
+    - citizens update their condition from the board as it was at the start of the step. As they all go
+      before any cop, an arrested Deviant is seen from the step after its arrest on (with random
+      activation the citizens stepping after the arrest see it in the same step)
+    - cops arrest, a citizen wanted by two cops goes to one of them
+    - citizens and cops that move pick their cell together, a cell wanted by two agents goes to one of them
+    Runs are headless: the engine starts from the environment layout and no agent objects are created.
+    """
+
+    def __init__(self, model, layout, risk_aversion):
+        self.model = model
+        self.torus = model.grid.torus
+        self.width, self.height = model.grid.width, model.grid.height
+        self.rng = np.random.default_rng(model.random.getrandbits(64))
+
+        citizens = layout == CITIZEN
+        self.breed = layout.astype(np.int8)
+        self.condition = np.zeros(layout.shape, dtype=np.int8)
+        self.risk_aversion = np.where(citizens, risk_aversion, 0.0)
+        self.threshold = np.where(citizens, model.active_threshold, 0.0)
+        self.steps_active = np.zeros(layout.shape, dtype=np.int32)
+        self.jail = np.zeros(layout.shape, dtype=bool)  # arrested, waiting on the board
+        self.arrest_order = np.zeros(layout.shape, dtype=np.int64)
+        self.can_arrest = layout == COP
+        self.wait_for = np.zeros(layout.shape, dtype=np.int32)
+        self.arrest_probability = np.zeros(layout.shape)
+        self.arrested_deviants = np.zeros(
+            layout.shape, dtype=bool
+        )  # cells of this step's arrests
+        self.arrests = 0
+        self.now = 0
+        # citizens in jail: the fields they keep and the step their sentence ends
+        self.inmates = {
+            "risk_aversion": np.zeros(0),
+            "threshold": np.zeros(0),
+            "release": np.zeros(0, dtype=np.int64),
+        }
+
+    def step(self):
+        """
+        Advance the board by one step
+        """
+        model = self.model
+        citizens = self.breed == CITIZEN
+        cops = self.breed == COP
+
+        # citizens, see Citizen.step
+        self.condition[citizens & (self.risk_aversion < 0.05)] = DEVIANT
+        free = citizens & ~self.jail
+        cops_near = neighbor_count(cops, self.torus)
+        actives_near = neighbor_count(free & (self.condition == ACTIVE), self.torus)
+        self.arrest_probability = np.where(
+            citizens,
+            1 - np.exp(-model.arrest_prob_constant * cops_near / (actives_near + 1.0)),
+            0.0,
+        )
+        jailed_deviants = diamond_count(
+            self.jail & (self.condition == DEVIANT) | self.arrested_deviants,
+            model.citizen_vision,
+            self.torus,
+        )
+        self.arrested_deviants[:] = False
+        self.threshold[citizens & (jailed_deviants > 0)] /= 2
+
+        gap = np.abs(
+            self.risk_aversion * self.arrest_probability - self.arrest_probability
+        )
+        calm = gap <= self.threshold
+        quiescent = self.condition == QUIESCENT
+        self.condition[citizens & quiescent & ~calm] = ACTIVE
+        self.condition[citizens & ~quiescent & calm] = QUIESCENT
+        rebels = citizens & (self.condition != QUIESCENT)
+        self.steps_active = np.where(rebels, self.steps_active + 1, 0).astype(np.int32)
+
+        # cops, see Cop.step
+        reset = cops & ~self.can_arrest & (self.wait_for == 0)
+        self.wait_for[cops & ~reset] -= 1
+        self.can_arrest[reset] = True
+        if model.jail_capacity > self.jailed:
+            self.arrest(cops & self.can_arrest & (cops_near > 1), free)
+
+        if model.movement:
+            self.move(citizens | (cops & self.can_arrest))
+        self.now += 1
+        self.release_inmates()
+        self.admit_to_jail()
+
+        model.schedule.steps += 1
+        model.schedule.time += 1
+
+    def arrest(self, eligible, free):
+        """
+        Every eligible cop arrests a random deviant neighbor (or active one, if no deviants are around)
+        that has been rebelling for at least 3 steps
+        """
+        xs, ys = np.nonzero(eligible)
+        if len(xs) == 0:
+            return
+        nx, ny, valid = self.neighbors(xs, ys)
+        around = free[nx, ny] & valid
+        deviants = around & (self.condition[nx, ny] == DEVIANT)
+        actives = around & (self.condition[nx, ny] == ACTIVE)
+        candidates = np.where(deviants.any(axis=1)[:, None], deviants, actives)
+        candidates &= self.steps_active[nx, ny] >= 3
+
+        col, has = self.pick(candidates)
+        xs, ys, col = xs[has], ys[has], col[has]
+        rows = np.flatnonzero(has)
+        tx, ty = nx[rows, col], ny[rows, col]
+        won = self.resolve(tx * self.height + ty)
+        xs, ys, tx, ty = xs[won], ys[won], tx[won], ty[won]
+
+        self.jail[tx, ty] = True
+        self.arrested_deviants[tx, ty] = self.condition[tx, ty] == DEVIANT
+        self.arrest_order[tx, ty] = self.arrests + np.arange(len(tx))
+        self.arrests += len(tx)
+        self.can_arrest[xs, ys] = False
+        self.wait_for[xs, ys] = 15
+
+    def move(self, movers):
+        """
+        Move every mover to a free neighboring cell, preferring the biased direction for citizens
+        and a step towards the closest deviant (or active) citizen in vision for cops
+        """
+        model = self.model
+        xs, ys = np.nonzero(movers)
+        if len(xs) == 0:
+            return
+        nx, ny, valid = self.neighbors(xs, ys)
+        open_cells = valid & (self.breed[nx, ny] == EMPTY)
+        preferred = np.zeros_like(open_cells)
+
+        is_citizen = self.breed[xs, ys] == CITIZEN
+        if model.direction_bias != "Random":
+            c = is_citizen
+            preferred[c] = model.flow.offsets[xs[c], ys[c]]
+
+        is_cop = ~is_citizen
+        if is_cop.any():
+            citizens = self.breed == CITIZEN
+            vision = model.cop_vision
+            field = pursuit_field(
+                citizens & (self.condition == DEVIANT),
+                citizens & (self.condition == ACTIVE),
+                vision,
+                self.torus,
+            )
+            c = is_cop
+            here = field[xs[c], ys[c]]
+            preferred[c] = (field[nx[c], ny[c]] < here[:, None]) & (here <= vision)[
+                :, None
+            ]
+
+        preferred &= open_cells
+        choices = np.where(preferred.any(axis=1)[:, None], preferred, open_cells)
+        col, has = self.pick(choices)
+        rows = np.flatnonzero(has)
+        xs, ys = xs[rows], ys[rows]
+        tx, ty = nx[rows, col[rows]], ny[rows, col[rows]]
+        won = self.resolve(tx * self.height + ty)
+        xs, ys, tx, ty = xs[won], ys[won], tx[won], ty[won]
+
+        for name in FIELDS:
+            field = getattr(self, name)
+            field[tx, ty] = field[xs, ys]
+        self.clear(xs, ys)
+
+    @property
+    def jailed(self):
+        return len(self.inmates["release"])
+
+    def release_inmates(self):
+        """
+        Put the citizens whose sentence has ended back on random free cells as Quiescent, as jail.Jail does
+        """
+        due = np.flatnonzero(self.inmates["release"] <= self.now)
+        if len(due) == 0:
+            return
+        empty = np.flatnonzero(self.breed == EMPTY)
+        due = due[: len(empty)]  # the rest waits for a free cell
+        cells = self.rng.choice(empty, len(due), replace=False)
+        xs, ys = np.unravel_index(cells, self.breed.shape)
+        self.breed[xs, ys] = CITIZEN
+        self.risk_aversion[xs, ys] = self.inmates["risk_aversion"][due]
+        self.threshold[xs, ys] = self.inmates["threshold"][due]
+        keep = np.ones(self.jailed, dtype=bool)
+        keep[due] = False
+        for name in self.inmates:
+            self.inmates[name] = self.inmates[name][keep]
+
+    def admit_to_jail(self):
+        """
+        Take waiting arrestees off the board, first arrested first, while the jail has room
+        """
+        room = self.model.jail_capacity - self.jailed
+        if room <= 0:
+            return
+        xs, ys = np.nonzero(self.jail)
+        order = np.argsort(self.arrest_order[xs, ys], kind="stable")[:room]
+        xs, ys = xs[order], ys[order]
+        max_term = self.model.max_jail_term
+        if max_term:
+            release = self.now + self.rng.integers(1, max_term + 1, len(xs))
+        else:
+            release = np.full(len(xs), np.iinfo(np.int64).max)
+        admitted = {
+            "risk_aversion": self.risk_aversion[xs, ys],
+            "threshold": self.threshold[xs, ys],
+            "release": release,
+        }
+        for name in self.inmates:
+            self.inmates[name] = np.concatenate([self.inmates[name], admitted[name]])
+        self.clear(xs, ys)
+
+    def clear(self, xs, ys):
+        for name in FIELDS:
+            getattr(self, name)[xs, ys] = 0
+
+    def neighbors(self, xs, ys):
+        """
+        (n, 4) coordinates of the radius 1 neighbors of the cells xs, ys and a mask of the ones on the board
+        """
+        dx = np.array([o[0] for o in OFFSETS])
+        dy = np.array([o[1] for o in OFFSETS])
+        nx = xs[:, None] + dx
+        ny = ys[:, None] + dy
+        if self.torus:
+            return nx % self.width, ny % self.height, np.ones(nx.shape, dtype=bool)
+        valid = (nx >= 0) & (nx < self.width) & (ny >= 0) & (ny < self.height)
+        return (
+            np.clip(nx, 0, self.width - 1),
+            np.clip(ny, 0, self.height - 1),
+            valid,
+        )
+
+    def pick(self, mask):
+        """
+        A random True column for every row of mask, and whether the row had one
+        """
+        keys = self.rng.random(mask.shape)
+        keys[~mask] = -1
+        return keys.argmax(axis=1), mask.any(axis=1)
+
+    def resolve(self, targets):
+        """
+        Indices of the requests that win their target, one random winner per target
+        """
+        order = self.rng.permutation(len(targets))
+        _, first = np.unique(targets[order], return_index=True)
+        return order[first]
+
+    def count(self, condition):
+        """
+        Citizens on the board that are not arrested, by condition.
+        Blocks are Quiescent too, as in ProtestersVsPolice.count_type_citizens.
+        """
+        free = (self.breed == CITIZEN) & ~self.jail
+        count = np.count_nonzero(free & (self.condition == CONDITIONS.index(condition)))
+        if condition == "Quiescent":
+            count += np.count_nonzero(self.breed == BLOCK)
+        return int(count)
+
+    def count_rebels(self):
+        citizens = self.breed == CITIZEN
+        return int(np.count_nonzero(citizens & (self.condition != QUIESCENT)))
@@ -0,0 +1,366 @@
+import numpy as np
+
+from .convergence import REPORTERS, ConvergenceDetector
+from .engine import (
+    ACTIVE,
+    BLOCK,
+    CITIZEN,
+    CONDITIONS,
+    COP,
+    DEVIANT,
+    EMPTY,
+    FIELDS,
+    QUIESCENT,
+    ArrayEngine,
+)
+from .spatial import diamond_count, neighbor_count, pursuit_field
+
+
+class EnsembleEngine(ArrayEngine):
+    """
+    Replicates of the array engine stacked on a leading axis: every field is a replicates x width x height
+    array and a step advances all replicates at once.
+    Replicate r starts from the board of its own ProtestersVsPolice(engine="array") and draws from that
+    model's generator, in the same order and amounts, so it runs exactly like that model would on its own.
+    The board wide rules are computed for all replicates together, only the random draws go replicate by replicate.
+    """
+
+    def __init__(self, models):
+        """
+        models: the array engine models of the replicates, all with the same parameters but the seed.
+        Taken one at a time, so only the stacked boards stay in memory.
+        """
+        fields = {name: [] for name in FIELDS}
+        arrested_deviants = []
+        self.rngs, self.inmates = [], []
+        for model in models:
+            engine = model.array_engine
+            if not self.rngs:
+                self.model = model
+                self.torus = engine.torus
+                self.width, self.height = engine.width, engine.height
+            for name in FIELDS:
+                fields[name].append(getattr(engine, name))
+            arrested_deviants.append(engine.arrested_deviants)
+            self.rngs.append(engine.rng)
+            self.inmates.append(engine.inmates)
+        for name in FIELDS:
+            setattr(self, name, np.stack(fields[name]))
+        self.arrested_deviants = np.stack(arrested_deviants)
+        self.replicates = len(self.rngs)
+        self.cells = self.width * self.height
+        # neighbors of every cell of one board, as flat indices
+        xs, ys = np.divmod(np.arange(self.cells), self.height)
+        nx, ny, self.table_valid = self.neighbors(xs, ys)
+        self.table = nx * self.height + ny
+        self.arrests = np.zeros(self.replicates, dtype=np.int64)
+        self.now = 0
+
+    def step(self):
+        """
+        Advance every replicate by one step, see ArrayEngine.step
+        """
+        model = self.model
+        citizens = self.breed == CITIZEN
+        cops = self.breed == COP
+
+        self.condition[citizens & (self.risk_aversion < 0.05)] = DEVIANT
+        free = citizens & ~self.jail
+        cops_near = neighbor_count(cops, self.torus)
+        actives_near = neighbor_count(free & (self.condition == ACTIVE), self.torus)
+        self.arrest_probability = np.where(
+            citizens,
+            1 - np.exp(-model.arrest_prob_constant * cops_near / (actives_near + 1.0)),
+            0.0,
+        )
+        jailed_deviants = diamond_count(
+            self.jail & (self.condition == DEVIANT) | self.arrested_deviants,
+            model.citizen_vision,
+            self.torus,
+        )
+        self.arrested_deviants[:] = False
+        self.threshold[citizens & (jailed_deviants > 0)] /= 2
+
+        gap = np.abs(
+            self.risk_aversion * self.arrest_probability - self.arrest_probability
+        )
+        calm = gap <= self.threshold
+        quiescent = self.condition == QUIESCENT
+        self.condition[citizens & quiescent & ~calm] = ACTIVE
+        self.condition[citizens & ~quiescent & calm] = QUIESCENT
+        rebels = citizens & (self.condition != QUIESCENT)
+        self.steps_active = np.where(rebels, self.steps_active + 1, 0).astype(np.int32)
+
+        reset = cops & ~self.can_arrest & (self.wait_for == 0)
+        self.wait_for[cops & ~reset] -= 1
+        self.can_arrest[reset] = True
+        room = model.jail_capacity > self.jailed
+        if room.any():
+            self.arrest(
+                cops & self.can_arrest & (cops_near > 1) & room[:, None, None], free
+            )
+
+        if model.movement:
+            self.move(citizens | (cops & self.can_arrest))
+        self.now += 1
+        self.release_inmates()
+        self.admit_to_jail()
+
+    def arrest(self, eligible, free):
+        cells = np.flatnonzero(eligible)
+        if len(cells) == 0:
+            return
+        rs = cells // self.cells
+        around, valid = self.around(cells, rs)
+        around_free = free.reshape(-1)[around] & valid
+        condition = self.condition.reshape(-1)[around]
+        deviants = around_free & (condition == DEVIANT)
+        actives = around_free & (condition == ACTIVE)
+        candidates = np.where(deviants.any(axis=1)[:, None], deviants, actives)
+        candidates &= self.steps_active.reshape(-1)[around] >= 3
+
+        col, has = self.pick(rs, candidates)
+        rows = np.flatnonzero(has)
+        targets = around[rows, col[rows]]
+        won = self.resolve(rs, rows, targets)
+        cops, targets, won_rs = cells[rows][won], targets[won], rs[rows][won]
+
+        # arrest order counts on per replicate, in the order the winners come
+        firsts = np.searchsorted(won_rs, won_rs)
+        self.jail.reshape(-1)[targets] = True
+        self.arrested_deviants.reshape(-1)[targets] = (
+            self.condition.reshape(-1)[targets] == DEVIANT
+        )
+        self.arrest_order.reshape(-1)[targets] = (
+            self.arrests[won_rs] + np.arange(len(won_rs)) - firsts
+        )
+        self.arrests += np.bincount(won_rs, minlength=self.replicates)
+        self.can_arrest.reshape(-1)[cops] = False
+        self.wait_for.reshape(-1)[cops] = 15
+
+    def move(self, movers):
+        model = self.model
+        cells = np.flatnonzero(movers)
+        if len(cells) == 0:
+            return
+        rs = cells // self.cells
+        around, valid = self.around(cells, rs)
+        open_cells = valid & (self.breed.reshape(-1)[around] == EMPTY)
+        preferred = np.zeros_like(open_cells)
+
+        is_citizen = self.breed.reshape(-1)[cells] == CITIZEN
+        if model.direction_bias != "Random":
+            c = is_citizen
+            local = cells[c] % self.cells
+            preferred[c] = model.flow.offsets.reshape(self.cells, -1)[local]
+
+        is_cop = ~is_citizen
+        if is_cop.any():
+            citizens = self.breed == CITIZEN
+            vision = model.cop_vision
+            field = pursuit_field(
+                citizens & (self.condition == DEVIANT),
+                citizens & (self.condition == ACTIVE),
+                vision,
+                self.torus,
+            ).reshape(-1)
+            c = is_cop
+            here = field[cells[c]]
+            preferred[c] = (field[around[c]] < here[:, None]) & (here <= vision)[
+                :, None
+            ]
+
+        preferred &= open_cells
+        choices = np.where(preferred.any(axis=1)[:, None], preferred, open_cells)
+        col, has = self.pick(rs, choices)
+        rows = np.flatnonzero(has)
+        targets = around[rows, col[rows]]
+        won = self.resolve(rs, rows, targets)
+        sources, targets = cells[rows][won], targets[won]
+
+        for name in FIELDS:
+            field = getattr(self, name).reshape(-1)
+            field[targets] = field[sources]
+        self.clear(sources)
+
+    def around(self, cells, rs):
+        """
+        Flat indices of the radius 1 neighbors of flat cells (of replicates rs), in the order of
+        ArrayEngine.neighbors (off the board ones clipped to the edge), and a mask of the ones on the board
+        """
+        start = rs * self.cells
+        local = cells - start
+        return self.table[local] + start[:, None], self.table_valid[local]
+
+    @property
+    def jailed(self):
+        return np.array([len(inmates["release"]) for inmates in self.inmates])
+
+    def release_inmates(self):
+        for r, inmates in enumerate(self.inmates):
+            due = np.flatnonzero(inmates["release"] <= self.now)
+            if len(due) == 0:
+                continue
+            empty = np.flatnonzero(self.breed[r] == EMPTY)
+            due = due[: len(empty)]
+            cells = self.rngs[r].choice(empty, len(due), replace=False)
+            xs, ys = np.unravel_index(cells, self.breed.shape[1:])
+            self.breed[r, xs, ys] = CITIZEN
+            self.risk_aversion[r, xs, ys] = inmates["risk_aversion"][due]
+            self.threshold[r, xs, ys] = inmates["threshold"][due]
+            keep = np.ones(len(inmates["release"]), dtype=bool)
+            keep[due] = False
+            for name in inmates:
+                inmates[name] = inmates[name][keep]
+
+    def admit_to_jail(self):
+        max_term = self.model.max_jail_term
+        for r, inmates in enumerate(self.inmates):
+            room = self.model.jail_capacity - len(inmates["release"])
+            if room <= 0:
+                continue
+            xs, ys = np.nonzero(self.jail[r])
+            order = np.argsort(self.arrest_order[r, xs, ys], kind="stable")[:room]
+            xs, ys = xs[order], ys[order]
+            if max_term:
+                release = self.now + self.rngs[r].integers(1, max_term + 1, len(xs))
+            else:
+                release = np.full(len(xs), np.iinfo(np.int64).max)
+            admitted = {
+                "risk_aversion": self.risk_aversion[r, xs, ys],
+                "threshold": self.threshold[r, xs, ys],
+                "release": release,
+            }
+            for name in inmates:
+                inmates[name] = np.concatenate([inmates[name], admitted[name]])
+            self.clear(r * self.cells + xs * self.height + ys)
+
+    def clear(self, cells):
+        for name in FIELDS:
+            getattr(self, name).reshape(-1)[cells] = 0
+
+    def pick(self, rs, mask):
+        """
+        A random True column for every row of mask, the keys of replicate r drawn from its own generator
+        """
+        replicates, counts = np.unique(rs, return_counts=True)
+        keys = np.concatenate(
+            [
+                self.rngs[r].random((n, mask.shape[1]))
+                for r, n in zip(replicates, counts)
+            ]
+        )
+        keys[~mask] = -1
+        return keys.argmax(axis=1), mask.any(axis=1)
+
+    def resolve(self, rs, rows, targets):
+        """
+        Indices into rows of the requests that win their target, one random winner per target,
+        drawn replicate by replicate. rs are the replicates of every requester (sorted), rows the ones that ask.
+        Every replicate with a requester draws, even when none of them asks, like ArrayEngine.resolve.
+        """
+        asking = rs[rows]
+        won = []
+        for r in np.unique(rs).tolist():
+            lo, hi = np.searchsorted(asking, [r, r + 1])
+            order = self.rngs[r].permutation(hi - lo)
+            _, first = np.unique(targets[lo:hi][order], return_index=True)
+            won.append(lo + order[first])
+        return np.concatenate(won)
+
+    def count(self, condition):
+        """
+        count of ArrayEngine, per replicate
+        """
+        free = (self.breed == CITIZEN) & ~self.jail
+        count = np.count_nonzero(
+            free & (self.condition == CONDITIONS.index(condition)), axis=(1, 2)
+        )
+        if condition == "Quiescent":
+            count += np.count_nonzero(self.breed == BLOCK, axis=(1, 2))
+        return count
+
+    def count_rebels(self):
+        citizens = self.breed == CITIZEN
+        return np.count_nonzero(citizens & (self.condition != QUIESCENT), axis=(1, 2))
+
+    def reporters(self):
+        """
+        The model reporters of every replicate: name -> one value per replicate
+        """
+        return {
+            "Quiescent": self.count("Quiescent"),
+            "Active": self.count("Active"),
+            "Deviant": self.count("Deviant"),
+            "Jailed": self.jailed,
+        }
+
+
+def ensemble_params(params):
+    """
+    The parameters the replicates of run_ensemble run with
+    """
+    return {**params, "engine": "array", "log_every": None, "record_every": None}
+
+
+def run_ensemble(params, replicates, max_steps=500, seed=0):
+    """
+    Run `replicates` replicates of one parameter set in one EnsembleEngine, replicate i with seed + i,
+    each the same run as ProtestersVsPolice(**params, engine="array", seed=seed + i).
+    Stops at max_steps, max_iters or, with converge_window, once every replicate has converged.
+    Returns one dict per replicate: seed, converged_at and the reporter series (step 0 is the start).
+    """
+    from .model import ProtestersVsPolice
+
+    params = ensemble_params(params)
+    engine = EnsembleEngine(
+        ProtestersVsPolice(**params, seed=seed + i) for i in range(replicates)
+    )
+    model = engine.model
+    steps = min(max_steps, model.max_iters + 1)
+
+    series = {
+        name: np.zeros((replicates, steps + 1), dtype=np.int64) for name in REPORTERS
+    }
+    length = np.full(replicates, steps + 1)
+    converged_at = [None] * replicates
+    detectors = []
+    if model.convergence is not None:
+        detectors = [
+            ConvergenceDetector(model.convergence.window, model.convergence.tolerance)
+            for _ in range(replicates)
+        ]
+
+    def record(step):
+        values = engine.reporters()
+        for name in REPORTERS:
+            series[name][:, step] = values[name]
+        for r, detector in enumerate(detectors):
+            if (
+                converged_at[r] is None
+                and step
+                and detector.update(
+                    {name: series[name][r, : step + 1] for name in REPORTERS}
+                )
+            ):
+                converged_at[r] = step
+                length[r] = step + 1
+
+    record(0)
+    for step in range(1, steps + 1):
+        engine.step()
+        record(step)
+        if detectors and all(c is not None for c in converged_at):
+            length[:] = np.minimum(length, step + 1)
+            break
+
+    return [
+        {
+            "seed": seed + r,
+            "converged_at": converged_at[r],
+            "series": {
+                name: series[name][r, : length[r]].tolist() for name in REPORTERS
+            },
+        }
+        for r in range(replicates)
+    ]
@@ -1,24 +1,76 @@
-from random import choices
-
 import numpy as np
-from mesa import Model
-from mesa.datacollection import DataCollector
-from mesa.space import Grid
-from mesa.time import RandomActivation
 
 from .agents import *
+from .engine import BLOCK, CITIZEN, COP, EMPTY
+
 
-def grid_adder(self, atype):
+def draw(rng, codes, probs, size):
+    """
+    One vectorized draw of `size` cells from codes with the given (unnormalized) probabilities
     """
-    Refactored adding to the grid. Just increments unique id and adds the object to the grid and schedule
+    probs = np.clip(np.asarray(probs, dtype=float), 0, None)
+    cumulative = np.cumsum(probs / probs.sum())
+    picks = np.searchsorted(cumulative, rng.random(size), side="right")
+    return np.asarray(codes, dtype=np.int8)[np.minimum(picks, len(codes) - 1)]
+
+
+def coordinates(self):
+    """
+    x and y of every cell, shaped like the grid
+    """
+    return np.meshgrid(
+        np.arange(self.grid.width), np.arange(self.grid.height), indexing="ij"
+    )
+
+
+def build_layout(self):
     """
-    if not atype == None:
+    Occupancy map of the chosen environment: a width x height array of cell codes,
+    and the risk aversion of the citizens (one uniform draw per cell, only used where there is a citizen)
+    """
+    rng = np.random.default_rng(self.random.getrandbits(64))
+    if self.environment == "Block in the middle":
+        layout = middle_block(self, rng, typea="block")
+    elif self.environment == "Cops in the middle":
+        layout = middle_block(self, rng, typea="cop")
+    elif self.environment == "Wall of cops":
+        layout = side_strategy(self, rng, "left", "cop")
+    elif self.environment == "Street":
+        layout = streets(self, rng)
+    else:
+        layout = random_strategy(self, rng)
+    return layout, rng.random(layout.shape)
+
+
+def populate(self, layout, risk_aversion):
+    """
+    Create agents for the occupied cells of a layout only, and add them to the grid, schedule and census
+    """
+    for x, y in zip(*np.nonzero(layout)):
+        x, y = int(x), int(y)
+        code = layout[x, y]
+        if code == CITIZEN:
+            agent = Citizen(
+                self.unique_id,
+                self,
+                (x, y),
+                risk_aversion=float(risk_aversion[x, y]),
+                threshold=self.active_threshold,
+                vision=self.citizen_vision,
+                aggression=self.aggression,
+                direction_bias=self.direction_bias,
+            )
+        elif code == COP:
+            agent = Cop(self.unique_id, self, (x, y), vision=self.cop_vision)
+        else:
+            agent = Block(self.unique_id, self, (x, y))
         self.unique_id += 1
-        self.grid.grid[self.x][self.y] = atype
-        self.schedule.add(atype)
+        self.grid.place_agent(agent, (x, y))
+        self.schedule.add(agent)
+        self.census.add(agent)
 
 
-def middle_block(self, typea="block"):
+def middle_block(self, rng, typea="block"):
     """
     walk around / block in the middle
     """
@@ -27,64 +79,39 @@ def middle_block(self, typea="block"):
     x_end = self.width - x_start
     y_end = self.height - y_start
 
-    num_blocks = 0
-    for (_, x, y) in self.grid.coord_iter():
-        if x_start <= x <= x_end and y_start <= y <= y_end:
-            self.x, self.y = x, y
-            if typea == "block":
-                grid_adder(self, Block(self.unique_id, self, (x, y)))
-            elif typea == "cop":
-                grid_adder(
-                    self, Cop(self.unique_id, self, (x, y), vision=self.cop_vision)
-                )
-            num_blocks += 1
+    x, y = coordinates(self)
+    middle = (x_start <= x) & (x <= x_end) & (y_start <= y) & (y <= y_end)
+    num_blocks = np.count_nonzero(middle)
 
     free = (self.numTotalSpaces - num_blocks) * self.grid_density
     citizenProb = (free * self.ratio) / self.numTotalSpaces
     freeProb = (self.numTotalSpaces - free - num_blocks) / self.numTotalSpaces
     if typea == "cop":
+        # the left over cop share stays empty, barricades go around the cops
         blockProb = self.barricade / self.numTotalSpaces
-        copProb = (
-            1 - citizenProb - freeProb - blockProb
+        copProb = 1 - citizenProb - freeProb - blockProb
+        layout = draw(
+            rng,
+            [EMPTY, CITIZEN, BLOCK],
+            [freeProb + copProb, citizenProb, blockProb],
+            middle.shape,
         )
+        layout[middle] = COP
     else:
+        # the left over block share stays empty
         copProb = (free - (free * self.ratio)) / self.numTotalSpaces
         blockProb = num_blocks / self.numTotalSpaces
-
-    print(blockProb, freeProb, citizenProb, copProb)
-    print(blockProb + freeProb + citizenProb + copProb)
-
-    for (_, x, y) in self.grid.coord_iter():
-        self.citizen = Citizen(
-            self.unique_id,
-            self,
-            (x, y),
-            risk_aversion=self.random.random(),
-            threshold=self.active_threshold,
-            vision=self.citizen_vision,
-            aggression=self.aggression,
-            direction_bias=self.direction_bias,
+        layout = draw(
+            rng,
+            [EMPTY, CITIZEN, COP],
+            [freeProb + blockProb, citizenProb, copProb],
+            middle.shape,
         )
+        layout[middle] = BLOCK
+    return layout
 
-        self.x, self.y = x, y
-        self.cop = Cop(self.unique_id, self, (x, y), vision=self.cop_vision)
-        self.block = Block(self.unique_id, self, (x, y))
-        agent_dict = {0: None, 1: self.citizen, 2: self.cop, 3: None}
-        agent_dict_d = {0: None, 1: self.citizen, 2: self.block, 3: None}
-        if x < x_start or x > x_end or y < y_start or y > y_end:
-            if typea == "block":
-                rand = choices(
-                    [0, 1, 2, 3], [freeProb, citizenProb, copProb, blockProb]
-                )
-                grid_adder(self, agent_dict[rand[0]])
-            elif typea == "cop":
-                rand = choices(
-                    [0, 1, 2, 3], [freeProb, citizenProb, blockProb, copProb]
-                )
-                grid_adder(self, agent_dict_d[rand[0]])
-
-
-def random_strategy(self):  # random distribution
+
+def random_strategy(self, rng):  # random distribution
     """
     Randomly places objects (original)
     """
@@ -95,80 +122,42 @@ def random_strategy(self):  # random distribution
     copProb = self.numCops / self.numTotalSpaces
     blockProb = self.barricade / self.numTotalSpaces
 
-    for (_, x, y) in self.grid.coord_iter():
-        self.citizen = Citizen(
-            self.unique_id,
-            self,
-            (x, y),
-            risk_aversion=self.random.random(),
-            direction_bias=self.direction_bias,
-            threshold=self.active_threshold,
-            vision=self.citizen_vision,
-            aggression=self.aggression,
-        )
-        self.cop = Cop(self.unique_id, self, (x, y), vision=self.cop_vision)
-        self.block = Block(self.unique_id, self, (x, y))
-
-        self.x, self.y = x, y
-        rand = choices([0, 1, 2, 3], [freeProb, citizenProb, copProb, blockProb])
-
-        agent_dict = {0: None, 1: self.citizen, 2: self.cop, 3: self.block}
-        grid_adder(self, agent_dict[rand[0]])
+    return draw(
+        rng,
+        [EMPTY, CITIZEN, COP, BLOCK],
+        [freeProb, citizenProb, copProb, blockProb],
+        (self.grid.width, self.grid.height),
+    )
 
 
-
-def side_strategy(self, side="left", agent="cop"):  # wall of cops
+def side_strategy(self, rng, side="left", agent="cop"):  # wall of cops
     """
     Left/right side : all of one type (eg all cops on the left)
     Rest filled randomly
-    Create zero array
-    Flatten the array and put the cops
-    Reshape back
+    The wall is the first (or last) numCops cells of the board, counted row by row
     """
-    h, w = self.height, self.width
-    self.temp_grid = np.reshape(self.grid.grid, -1)  # flatten
-
-    if side == "left":  # Set cops
-        self.temp_grid[: int(self.numCops)] = 2
+    x, y = coordinates(self)
+    flat = y * self.grid.width + x
+    num_cops = int(self.numCops)
+    if side == "left":
+        wall = flat < num_cops
     else:
-        self.temp_grid[-int(self.numCops) :] = 2
+        wall = flat >= self.numTotalSpaces - num_cops
 
-    self.temp_grid = np.reshape(self.temp_grid, (h, w))
     citizenProb = self.numCitizens / self.numTotalSpaces
     freeProb = (
         self.numTotalSpaces - self.numFreeSpaces - self.barricade
     ) / self.numTotalSpaces
-    copProb = self.numCops / self.numTotalSpaces
     blockProb = self.barricade / self.numTotalSpaces
 
-    for (_, x, y) in self.grid.coord_iter():
-        self.citizen = Citizen(
-            self.unique_id,
-            self,
-            (x, y),
-            risk_aversion=self.random.random(),
-            direction_bias=self.direction_bias,
-            threshold=self.active_threshold,
-            vision=self.citizen_vision,
-            aggression=self.aggression,
-        )
-
-        self.cop = Cop(self.unique_id, self, (x, y), vision=self.cop_vision)
-        self.block = Block(self.unique_id, self, (x, y))
-
-        agent_dict = {0: None, 1: self.citizen, 2: self.cop, 3: self.block}
-
-        self.x, self.y = x, y
-
-        if self.temp_grid[y][x] == 2:
-            grid_adder(self, agent_dict[2])
-
-        else:
-            rand = choices([0, 1, 3], [freeProb, citizenProb, blockProb])
-            grid_adder(self, agent_dict[rand[0]])
+    layout = draw(
+        rng, [EMPTY, CITIZEN, BLOCK], [freeProb, citizenProb, blockProb], wall.shape
+    )
+    layout[wall] = COP
+    return layout
 
 
-def streets(self):
+def streets(self, rng):
     # middle
     y_start = self.height / 6
     y_end = self.height - y_start
@@ -177,39 +166,21 @@ def streets(self):
     x_end = self.width / 6
     x_start = self.width - x_end
 
-    num_blocks = 0
-    for (_, x, y) in self.grid.coord_iter():
-        if (
-            x >= x_start
-            or x <= x_end
-            or ((x == x_mid or x == (x_mid + 1)) and y_start <= y <= y_end)
-        ):
-            self.x, self.y = x, y
-            grid_adder(self, Block(self.unique_id, self, (x, y)))
-            num_blocks += 1
+    x, y = coordinates(self)
+    blocks = (
+        (x >= x_start)
+        | (x <= x_end)
+        | (((x == x_mid) | (x == x_mid + 1)) & (y_start <= y) & (y <= y_end))
+    )
+    num_blocks = np.count_nonzero(blocks)
 
     free = (self.numTotalSpaces - num_blocks) * self.grid_density
     citizenProb = (free * self.ratio) / self.numTotalSpaces
     freeProb = (self.numTotalSpaces - free - num_blocks) / self.numTotalSpaces
     copProb = (free - (free * self.ratio)) / self.numTotalSpaces
-    blockProb = num_blocks / self.numTotalSpaces
-
-    for (_, x, y) in self.grid.coord_iter():
-        self.citizen = Citizen(
-            self.unique_id,
-            self,
-            (x, y),
-            risk_aversion=self.random.random(),
-            threshold=self.active_threshold,
-            vision=self.citizen_vision,
-            aggression=self.aggression,
-            direction_bias=self.direction_bias,
-        )
-        self.x, self.y = x, y
-        self.cop = Cop(self.unique_id, self, (x, y), vision=self.cop_vision)
-        agent_dict = {0: None, 1: self.citizen, 2: self.cop}
-        if x_start > x > x_end and (
-            x != x_mid and x != (x_mid + 1) or (y < y_start or y > y_end)
-        ):
-            rand = choices([0, 1, 2], [freeProb, citizenProb, copProb])
-            grid_adder(self, agent_dict[rand[0]])
+
+    layout = draw(
+        rng, [EMPTY, CITIZEN, COP], [freeProb, citizenProb, copProb], blocks.shape
+    )
+    layout[blocks] = BLOCK
+    return layout
@@ -0,0 +1,56 @@
+import numpy as np
+from mesa.space import Grid
+
+from .spatial import neighborhood_table
+
+
+class TrackedGrid(Grid):
+    """
+    mesa Grid that keeps track of where things change.
+    Every change to a cell (an agent placed, moved or removed, a citizen flipping condition or being
+    arrested) ticks `clock` and stamps the cell with it. A citizen that remembers the clock when it last
+    looked around only has to look again if its cell or a neighboring one was stamped since.
+    """
+
+    def __init__(self, width, height, torus):
+        super().__init__(width, height, torus)
+        self.clock = 0
+        self.stamps = [0] * (width * height)
+        # every cell and its neighbors, border cells padded with themselves
+        index = neighborhood_table(width, height, 1, torus).index
+        cells = np.arange(width * height).reshape(-1, 1)
+        self.regions = np.hstack([cells, np.where(index < 0, cells, index)]).tolist()
+
+    def touch(self, pos):
+        """
+        Stamp a change at pos
+        """
+        x, y = pos
+        self.clock += 1
+        self.stamps[x * self.height + y] = self.clock
+
+    def changed_since(self, pos, clock):
+        """
+        Whether anything at pos or next to it changed after the given clock
+        """
+        x, y = pos
+        stamps = self.stamps
+        for i in self.regions[x * self.height + y]:
+            if stamps[i] > clock:
+                return True
+        return False
+
+    # mesa's own bookkeeping, inlined: these run on every move
+    def _place_agent(self, pos, agent):
+        x, y = pos
+        self.grid[x][y] = agent
+        self.empties.discard(pos)
+        self.clock += 1
+        self.stamps[x * self.height + y] = self.clock
+
+    def _remove_agent(self, pos, agent):
+        x, y = pos
+        self.grid[x][y] = None
+        self.empties.add(pos)
+        self.clock += 1
+        self.stamps[x * self.height + y] = self.clock
@@ -0,0 +1,89 @@
+from collections import deque
+
+
+class Jail:
+    """
+    Arrested citizens stay on the grid in a FIFO queue until the jail has room (capacity).
+    Once inside they get a sentence of 1 to max_term steps, kept in a timing wheel with one slot per step,
+    and go back to a random free cell when it ends. max_term=None keeps them in jail for good.
+    A step only touches the citizens that are released or let in during it.
+    An arrested Deviant is in sight of the citizens that step after its arrest (model.arrested_deviant)
+    and of everyone for as long as it waits on the grid. The old admission loop skipped every other
+    arrestee, so more of them waited a step and were seen. Admitting all of them while there is room
+    means fewer halved thresholds than before, on top of the fix to the count itself.
+    """
+
+    def __init__(self, model, capacity, max_term=None):
+        self.model = model
+        self.capacity = capacity
+        self.max_term = max_term
+        self.pending = deque()  # arrested, waiting on the grid
+        self.inmates = 0
+        self.wheel = [[] for _ in range(max_term + 1)] if max_term else None
+        self.now = 0
+
+    def __len__(self):
+        return self.inmates
+
+    def has_room(self):
+        return self.inmates < self.capacity
+
+    def arrest(self, agent):
+        agent.jail_sentence = True
+        self.pending.append(agent)
+        if agent.condition == "Deviant":
+            self.model.arrested_deviant(agent.pos)
+
+    def step(self):
+        """
+        Release the citizens whose sentence ends now, then let in waiting arrestees while there is room
+        """
+        self.now += 1
+        if self.wheel is not None:
+            slot = self.now % len(self.wheel)
+            due, self.wheel[slot] = self.wheel[slot], []
+            for agent in due:
+                if not self.release(agent):
+                    self.wheel[(slot + 1) % len(self.wheel)].append(agent)
+        while self.pending and self.has_room():
+            self.admit(self.pending.popleft())
+
+    def admit(self, agent):
+        model = self.model
+        model.census.remove(agent)
+        model.schedule.remove(agent)
+        model.grid.remove_agent(agent)
+        self.inmates += 1
+        if self.wheel is not None:
+            term = model.random.randint(1, self.max_term)
+            self.wheel[(self.now + term) % len(self.wheel)].append(agent)
+
+    def release(self, agent):
+        """
+        Put a citizen back on a random free cell as Quiescent, False if the grid is full
+        """
+        model = self.model
+        pos = self.free_cell()
+        if pos is None:
+            return False
+        self.inmates -= 1
+        agent.jail_sentence = False
+        agent.condition = "Quiescent"
+        agent.steps_active = 0
+        model.grid.place_agent(agent, pos)
+        model.schedule.add(agent)
+        model.census.add(agent)
+        return True
+
+    def free_cell(self, tries=100):
+        """
+        A random empty cell: try random cells first, the grid is rarely that full
+        """
+        grid, rng = self.model.grid, self.model.random
+        for _ in range(tries):
+            pos = (rng.randrange(grid.width), rng.randrange(grid.height))
+            if grid.is_cell_empty(pos):
+                return pos
+        if grid.empties:
+            return rng.choice(sorted(grid.empties))
+        return None
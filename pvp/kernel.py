@@ -0,0 +1,591 @@
+import math
+
+import numpy as np
+
+from .engine import ACTIVE, BLOCK, CITIZEN, CONDITIONS, COP, DEVIANT, QUIESCENT
+from .spatial import neighborhood_table
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+AVAILABLE = njit is not None
+
+# state of a SequentialEngine, as saved by checkpoint.snapshot
+FIELDS = (
+    "breed",
+    "pos",
+    "cells",
+    "condition",
+    "jail_sentence",
+    "risk_aversion",
+    "threshold",
+    "steps_active",
+    "arrest_probability",
+    "can_arrest",
+    "wait_for",
+    "release",
+    "queued",
+    "order",
+    "pending",
+    "counters",
+    "counts",
+)
+
+# SequentialEngine.counters
+SCHEDULED, PENDING_HEAD, PENDING, INMATES, NOW, QUEUED = range(6)
+
+# Mersenne Twister of CPython's random module
+N, M = 624, 397
+
+
+def jit(function):
+    """
+    numba compiled function when numba is installed, the same Python function otherwise
+    """
+    return njit(cache=True)(function) if AVAILABLE else function
+
+
+class SequentialEngine:
+    """
+    Steps ProtestersVsPolice exactly like the agents engine with random activation, in one compiled loop
+    (engine="compiled", needs numba). Agents are numbered like populate creates them, every field is an
+    array over the agents and the grid holds agent numbers, -1 where a cell is empty.
+    A step works out the jailed Deviants in sight and the pursuit field, goes through the same shuffled order
+    of citizens and cops as BreedActivation, applying Citizen.step and Cop.step one agent at a time, and
+    then does Jail.step. The random draws come from a copy of
+    model.random's Mersenne Twister, in the same order as the agents engine makes them, so a run gives the
+    same counts as engine="agents" with the same seed. Runs are headless, like the array engine.
+    """
+
+    def __init__(self, model, layout, risk_aversion):
+        self.model = model
+        self.torus = model.grid.torus
+        self.width, self.height = model.grid.width, model.grid.height
+
+        xs, ys = np.nonzero(layout)  # the order populate creates the agents in
+        n = len(xs)
+        self.breed = layout[xs, ys].astype(np.int8)
+        citizens = self.breed == CITIZEN
+        self.pos = (xs * self.height + ys).astype(np.int64)  # flat cell, -1 in jail
+        self.cells = np.full(self.width * self.height, -1, dtype=np.int64)
+        self.cells[self.pos] = np.arange(n)
+        self.condition = np.zeros(n, dtype=np.int8)
+        self.jail_sentence = np.zeros(n, dtype=bool)
+        self.risk_aversion = np.where(citizens, risk_aversion[xs, ys], 0.0)
+        self.threshold = np.where(citizens, model.active_threshold, 0.0)
+        self.steps_active = np.zeros(n, dtype=np.int64)
+        self.arrest_probability = np.full(n, np.nan)
+        self.can_arrest = self.breed == COP
+        self.wait_for = np.zeros(n, dtype=np.int64)
+        # jail: step a sentence ends and when the citizen was put in its timing wheel slot
+        self.release = np.full(n, -1, dtype=np.int64)
+        self.queued = np.zeros(n, dtype=np.int64)
+
+        # scheduled citizens in the order the schedule keeps them, then the cops
+        self.order = np.zeros(n, dtype=np.int64)
+        self.order[: np.count_nonzero(citizens)] = np.flatnonzero(citizens)
+        self.cops = np.flatnonzero(self.breed == COP)
+        self.pending = np.zeros(
+            n, dtype=np.int64
+        )  # FIFO ring of arrested citizens on the grid
+        self.counters = np.zeros(6, dtype=np.int64)
+        self.counters[SCHEDULED] = np.count_nonzero(citizens)
+        # census: not arrested citizens by condition (and Blocks, as Quiescent), then arrested ones
+        self.counts = np.zeros(6, dtype=np.int64)
+        self.counts[QUIESCENT] = np.count_nonzero(citizens | (self.breed == BLOCK))
+
+        table = neighborhood_table(self.width, self.height, 1, self.torus)
+        self.table = table.index.astype(np.int64)
+        # Citizen.estimate_arrest_probability for every count of cops and actives around
+        size = self.table.shape[1] + 1
+        self.probs = np.array(
+            [
+                [
+                    1
+                    - math.exp(
+                        -1 * model.arrest_prob_constant * (cops / (1.0 + actives))
+                    )
+                    for actives in range(size)
+                ]
+                for cops in range(size)
+            ]
+        )
+        # Citizen.preferred_moves, lined up with table
+        self.flow = model.flow.index
+
+    def step(self):
+        """
+        Advance the board by one step, see ProtestersVsPolice.step_agents
+        """
+        model = self.model
+        version, state, gauss = model.random.getstate()
+        mt = np.array(state[:N], dtype=np.int64)
+        mt_pos = np.array([state[N]], dtype=np.int64)
+        step_board(
+            self.cells,
+            self.table,
+            self.breed,
+            self.pos,
+            self.condition,
+            self.jail_sentence,
+            self.risk_aversion,
+            self.threshold,
+            self.steps_active,
+            self.arrest_probability,
+            self.can_arrest,
+            self.wait_for,
+            self.release,
+            self.queued,
+            self.order,
+            self.cops,
+            self.pending,
+            self.counters,
+            self.counts,
+            self.probs,
+            self.flow,
+            self.height,
+            self.torus,
+            model.movement,
+            model.citizen_vision,
+            model.cop_vision,
+            model.jail_capacity,
+            model.max_jail_term or 0,
+            model.schedule.park_cops,
+            mt,
+            mt_pos,
+        )
+        model.random.setstate((version, tuple(mt.tolist()) + (int(mt_pos[0]),), gauss))
+
+        model.schedule.steps += 1
+        model.schedule.time += 1
+
+    @property
+    def jailed(self):
+        return int(self.counters[INMATES])
+
+    @property
+    def jail(self):
+        """
+        Arrested citizens still on the grid
+        """
+        return self.jail_sentence & (self.pos >= 0)
+
+    def count(self, condition):
+        """
+        Citizens on the grid that are not arrested, by condition. Blocks are Quiescent too.
+        """
+        return int(self.counts[CONDITIONS.index(condition)])
+
+    def count_rebels(self):
+        return int(self.counts[[ACTIVE, DEVIANT, 3 + ACTIVE, 3 + DEVIANT]].sum())
+
+
+@jit
+def genrand(mt, mt_pos):
+    """
+    Next 32 bit output of the generator, as random.getrandbits(32)
+    """
+    if mt_pos[0] >= N:
+        for k in range(N):
+            y = (mt[k] & 0x80000000) | (mt[(k + 1) % N] & 0x7FFFFFFF)
+            value = mt[(k + M) % N] ^ (y >> 1)
+            if y & 1:
+                value ^= 0x9908B0DF
+            mt[k] = value
+        mt_pos[0] = 0
+    y = mt[mt_pos[0]]
+    mt_pos[0] += 1
+    y ^= y >> 11
+    y ^= (y << 7) & 0x9D2C5680
+    y ^= (y << 15) & 0xEFC60000
+    y ^= y >> 18
+    return y
+
+
+@jit
+def randbelow(n, mt, mt_pos):
+    """
+    random.randrange(n), for 0 < n < 2**32
+    """
+    k = 0
+    while n >> k:
+        k += 1
+    r = genrand(mt, mt_pos) >> (32 - k)
+    while r >= n:
+        r = genrand(mt, mt_pos) >> (32 - k)
+    return r
+
+
+@jit
+def set_condition(a, value, condition, jail_sentence, counts):
+    old = condition[a]
+    if value != old:
+        arrested = 3 if jail_sentence[a] else 0
+        counts[arrested + old] -= 1
+        counts[arrested + value] += 1
+        condition[a] = value
+
+
+@jit
+def move(a, target, cells, pos):
+    cells[pos[a]] = -1
+    cells[target] = a
+    pos[a] = target
+
+
+@jit
+def free_cell(cells, height, mt, mt_pos):
+    """
+    Jail.free_cell: 100 random tries, then a random empty cell, -1 if the grid is full
+    """
+    width = len(cells) // height
+    for _ in range(100):
+        x = randbelow(width, mt, mt_pos)
+        y = randbelow(height, mt, mt_pos)
+        if cells[x * height + y] < 0:
+            return x * height + y
+    empty = 0
+    for c in range(len(cells)):
+        if cells[c] < 0:
+            empty += 1
+    if empty == 0:
+        return -1
+    r = randbelow(empty, mt, mt_pos)
+    for c in range(len(cells)):
+        if cells[c] < 0:
+            if r == 0:
+                return c
+            r -= 1
+    return -1
+
+
+@jit
+def mark_diamond(seen, p, radius, height, width, torus):
+    """
+    Mark the cells within radius of flat cell p (von Neumann, center excluded)
+    """
+    x0, y0 = p // height, p % height
+    for dx in range(-radius, radius + 1):
+        reach = radius - abs(dx)
+        for dy in range(-reach, reach + 1):
+            if dx == 0 and dy == 0:
+                continue
+            x, y = x0 + dx, y0 + dy
+            if torus:
+                x, y = x % width, y % height
+            elif x < 0 or x >= width or y < 0 or y >= height:
+                continue
+            seen[x * height + y] = True
+
+
+@jit
+def jailed_deviants(pos, condition, pending, head, count, radius, height, width, torus):
+    """
+    Cells with an arrested Deviant on the grid within radius (von Neumann, center excluded),
+    where ProtestersVsPolice.count_jailed_deviants is > 0
+    """
+    seen = np.zeros(width * height, dtype=np.bool_)
+    for i in range(count):
+        a = pending[(head + i) % len(pending)]
+        if condition[a] == DEVIANT:
+            mark_diamond(seen, pos[a], radius, height, width, torus)
+    return seen
+
+
+@jit
+def distance_field(mask, table, radius):
+    """
+    spatial.distance_field on flat cells, relaxed over the neighborhood table
+    """
+    dist = np.where(mask, 0, radius + 1)
+    nearest = dist.copy()
+    for _ in range(radius):
+        for c in range(len(dist)):
+            d = dist[c]
+            for k in range(table.shape[1]):
+                n = table[c, k]
+                if n < 0:
+                    break
+                if dist[n] + 1 < d:
+                    d = dist[n] + 1
+            nearest[c] = d
+        dist, nearest = nearest, dist
+    return dist
+
+
+@jit
+def pursuit_field(cells, breed, condition, table, radius):
+    """
+    spatial.pursuit_field of the citizens on the grid, as ProtestersVsPolice.build_pursuit_field
+    """
+    deviants = np.zeros(len(cells), dtype=np.bool_)
+    actives = np.zeros(len(cells), dtype=np.bool_)
+    for c in range(len(cells)):
+        a = cells[c]
+        if a >= 0 and breed[a] == CITIZEN:
+            if condition[a] == DEVIANT:
+                deviants[c] = True
+            elif condition[a] == ACTIVE:
+                actives[c] = True
+    to_deviant = distance_field(deviants, table, radius)
+    to_active = distance_field(actives, table, radius)
+    return np.where(to_deviant <= radius, to_deviant, to_active)
+
+
+@jit
+def step_board(
+    cells,
+    table,
+    breed,
+    pos,
+    condition,
+    jail_sentence,
+    risk_aversion,
+    threshold,
+    steps_active,
+    arrest_probability,
+    can_arrest,
+    wait_for,
+    release,
+    queued,
+    order,
+    cops,
+    pending,
+    counters,
+    counts,
+    probs,
+    flow,
+    height,
+    torus,
+    movement,
+    citizen_vision,
+    cop_vision,
+    capacity,
+    max_term,
+    park_cops,
+    mt,
+    mt_pos,
+):
+    """
+    One step of every scheduled citizen and cop, in shuffled order, then one of the jail
+    """
+    size = table.shape[1]
+    width = len(cells) // height
+    seen = jailed_deviants(
+        pos,
+        condition,
+        pending,
+        counters[PENDING_HEAD],
+        counters[PENDING],
+        citizen_vision,
+        height,
+        width,
+        torus,
+    )
+    pursuit = pursuit_field(cells, breed, condition, table, cop_vision)
+    empties = np.empty(size, dtype=np.int64)
+    choices = np.empty(size, dtype=np.int64)
+    deviants = np.empty(size, dtype=np.int64)
+    actives = np.empty(size, dtype=np.int64)
+
+    # BreedActivation.step
+    actors = np.empty(counters[SCHEDULED] + len(cops), dtype=np.int64)
+    n = 0
+    for i in range(counters[SCHEDULED]):
+        actors[n] = order[i]
+        n += 1
+    for cop in cops:
+        if not park_cops or can_arrest[cop] or wait_for[cop] <= 0:
+            actors[n] = cop
+            n += 1
+        else:
+            wait_for[cop] -= 1
+    for i in range(n - 1, 0, -1):
+        j = randbelow(i + 1, mt, mt_pos)
+        actors[i], actors[j] = actors[j], actors[i]
+
+    for i in range(n):
+        a = actors[i]
+        if breed[a] == CITIZEN:
+            # Citizen.step
+            if risk_aversion[a] < 0.05:
+                set_condition(a, DEVIANT, condition, jail_sentence, counts)
+            p = pos[a]
+            cops_near, actives_near, n_empty, n_choices = 0, 0, 0, 0
+            for k in range(size):
+                c = table[p, k]
+                if c < 0:
+                    break
+                b = cells[c]
+                if b < 0:
+                    empties[n_empty] = c
+                    n_empty += 1
+                    if flow[p, k]:
+                        choices[n_choices] = c
+                        n_choices += 1
+                elif breed[b] == COP:
+                    cops_near += 1
+                elif (
+                    breed[b] == CITIZEN
+                    and condition[b] == ACTIVE
+                    and not jail_sentence[b]
+                ):
+                    actives_near += 1
+            probability = probs[cops_near, actives_near]
+            arrest_probability[a] = probability
+            if seen[p]:
+                threshold[a] = threshold[a] / 2
+            gap = abs(risk_aversion[a] * probability - probability)
+            now = condition[a]
+            if now == QUIESCENT and gap > threshold[a]:
+                set_condition(a, ACTIVE, condition, jail_sentence, counts)
+            elif now == ACTIVE and gap <= threshold[a]:
+                set_condition(a, QUIESCENT, condition, jail_sentence, counts)
+            elif now == DEVIANT and gap <= threshold[a]:
+                set_condition(a, QUIESCENT, condition, jail_sentence, counts)
+
+            if movement and n_empty > 0:
+                # Citizen.choose_direction, or a random move ("Random" has no preferred moves)
+                if n_choices > 0:
+                    target = choices[randbelow(n_choices, mt, mt_pos)]
+                else:
+                    target = empties[randbelow(n_empty, mt, mt_pos)]
+                move(a, target, cells, pos)
+
+            if condition[a] == ACTIVE or condition[a] == DEVIANT:
+                steps_active[a] += 1
+            else:
+                steps_active[a] = 0
+        else:
+            # Cop.step
+            if not can_arrest[a] and wait_for[a] == 0:
+                can_arrest[a] = True
+            else:
+                wait_for[a] -= 1
+            p = pos[a]
+
+            if can_arrest[a] and counters[INMATES] < capacity:
+                cops_near = 0
+                for k in range(size):
+                    c = table[p, k]
+                    if c < 0:
+                        break
+                    if cells[c] >= 0 and breed[cells[c]] == COP:
+                        cops_near += 1
+                if cops_near > 1:
+                    any_deviant, any_active = False, False
+                    n_deviants, n_actives = 0, 0
+                    for k in range(size):
+                        c = table[p, k]
+                        if c < 0:
+                            break
+                        b = cells[c]
+                        if b < 0 or breed[b] != CITIZEN or jail_sentence[b]:
+                            continue
+                        if condition[b] == ACTIVE:
+                            any_active = True
+                            if steps_active[b] >= 3:
+                                actives[n_actives] = b
+                                n_actives += 1
+                        elif condition[b] == DEVIANT:
+                            any_deviant = True
+                            if steps_active[b] >= 3:
+                                deviants[n_deviants] = b
+                                n_deviants += 1
+                    arrestee = -1
+                    if any_deviant:
+                        if n_deviants > 0:
+                            arrestee = deviants[randbelow(n_deviants, mt, mt_pos)]
+                    elif any_active:
+                        if n_actives > 0:
+                            arrestee = actives[randbelow(n_actives, mt, mt_pos)]
+                    if arrestee >= 0:
+                        # Jail.arrest
+                        jail_sentence[arrestee] = True
+                        counts[condition[arrestee]] -= 1
+                        counts[3 + condition[arrestee]] += 1
+                        tail = (counters[PENDING_HEAD] + counters[PENDING]) % len(
+                            pending
+                        )
+                        pending[tail] = arrestee
+                        counters[PENDING] += 1
+                        if condition[arrestee] == DEVIANT:
+                            # ProtestersVsPolice.arrested_deviant
+                            mark_diamond(
+                                seen,
+                                pos[arrestee],
+                                citizen_vision,
+                                height,
+                                width,
+                                torus,
+                            )
+                        can_arrest[a] = False
+                        wait_for[a] = 15
+
+            if movement and can_arrest[a]:
+                n_empty = 0
+                for k in range(size):
+                    c = table[p, k]
+                    if c < 0:
+                        break
+                    if cells[c] < 0:
+                        empties[n_empty] = c
+                        n_empty += 1
+                if n_empty > 0:
+                    # Cop.move_towards_actives
+                    n_choices = 0
+                    here = pursuit[p]
+                    if here <= cop_vision:
+                        for k in range(n_empty):
+                            if pursuit[empties[k]] < here:
+                                choices[n_choices] = empties[k]
+                                n_choices += 1
+                    if n_choices > 0:
+                        target = choices[randbelow(n_choices, mt, mt_pos)]
+                    else:
+                        target = empties[randbelow(n_empty, mt, mt_pos)]
+                    move(a, target, cells, pos)
+
+    # Jail.step
+    counters[NOW] += 1
+    now = counters[NOW]
+    if max_term > 0:
+        due = np.flatnonzero(release == now)
+        due = due[np.argsort(queued[due])]
+        for a in due:
+            target = free_cell(cells, height, mt, mt_pos)
+            if target < 0:
+                release[a] = now + 1
+                queued[a] = counters[QUEUED]
+                counters[QUEUED] += 1
+                continue
+            counters[INMATES] -= 1
+            release[a] = -1
+            jail_sentence[a] = False
+            condition[a] = QUIESCENT
+            steps_active[a] = 0
+            cells[target] = a
+            pos[a] = target
+            order[counters[SCHEDULED]] = a
+            counters[SCHEDULED] += 1
+            counts[QUIESCENT] += 1
+    while counters[PENDING] > 0 and counters[INMATES] < capacity:
+        a = pending[counters[PENDING_HEAD]]
+        counters[PENDING_HEAD] = (counters[PENDING_HEAD] + 1) % len(pending)
+        counters[PENDING] -= 1
+        counts[3 + condition[a]] -= 1
+        counters[SCHEDULED] -= 1
+        i = 0
+        while order[i] != a:
+            i += 1
+        for j in range(i, counters[SCHEDULED]):
+            order[j] = order[j + 1]
+        cells[pos[a]] = -1
+        pos[a] = -1
+        counters[INMATES] += 1
+        if max_term > 0:
+            release[a] = now + 1 + randbelow(max_term, mt, mt_pos)
+            queued[a] = counters[QUEUED]
+            counters[QUEUED] += 1
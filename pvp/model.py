@@ -1,16 +1,31 @@
-import os
-from random import choices
+import random
+import uuid
+import warnings
 
 import numpy as np
 from mesa import Model
-from mesa.datacollection import DataCollector
-from mesa.space import Grid
-from mesa.time import RandomActivation
 
-from .agents.block import Block
-from .agents.citizen import Citizen
-from .agents.cop import Cop
+from .census import Census
+from .checkpoint import load_agents, load_progress
+from .convergence import ConvergenceDetector
+from .datacollection import DataCollector
+from .engine import ArrayEngine
 from .environments import *
+from .grid import TrackedGrid
+from .jail import Jail
+from .kernel import AVAILABLE as KERNEL_AVAILABLE
+from .kernel import SequentialEngine
+from .profiling import NullProfiler, Profiler, instrument, reporter_names
+from .recorder import AgentRecorder
+from .schedule import BreedActivation, SimultaneousActivation
+from .spatial import (
+    add_diamond,
+    diamond_count,
+    flow_field,
+    neighborhood_table,
+    pursuit_field,
+)
+from .writer import ExperimentWriter
 
 try:
     from playsound import playsound
@@ -33,7 +48,8 @@ class ProtestersVsPolice(Model):
             citizen can inspect
         cop_vision: number of cells in each direction (N, S, E and W) that cop
             can inspect
-        max_jail_term: (J_max)
+        max_jail_term: (J_max) jailed citizens serve 1 to max_jail_term steps,
+            None keeps them in jail for good
         active_threshold: if (net risk - (risk_aversion * arrest_probability))
             > threshold, citizen rebels
         arrest_prob_constant: set to ensure agents make plausible arrest
@@ -41,6 +57,43 @@ class ProtestersVsPolice(Model):
         movement: binary, whether agents try to move at step end
         max_iters: model may not have a natural stopping point, so we set a
             max.
+        engine: "agents" steps the Citizen/Cop objects through the schedule,
+            "array" steps the whole board at once on numpy arrays (headless,
+            see engine.ArrayEngine), "compiled" runs the exact steps of
+            "agents" with random activation in a numba loop (headless, see
+            kernel.SequentialEngine; "agents" is used if numba is missing)
+        run_id: name of this run's files in experiments/ (random if not
+            given)
+        log_every: append the new reporter rows to experiments/<run_id>.csv
+            every this many steps, None turns the log off
+        collect_window: keep only this many recent steps of the reporters in
+            memory (see datacollection.DataCollector), None keeps them all.
+            Older steps still go to the log when log_every is set. For flat
+            memory over any number of steps also set record_every=None
+        record_every: record agent level data every this many steps, None
+            turns it off (see recorder.AgentRecorder, agent engine only)
+        record_breeds: breeds to record agent level data for
+        record_fields: agent fields to record, None records all of them
+        park_cops: skip the step of cops on arrest cooldown and only count
+            the cooldown down, see schedule.BreedActivation
+        activation: "random" steps the agents one after the other in random
+            order, each seeing what the previous ones did. "simultaneous"
+            lets all citizens decide on the same board and then applies the
+            decisions together (see schedule.SimultaneousActivation), agent
+            engine only
+        converge_window: stop the run once the mean Quiescent/Active/Deviant/
+            Jailed counts over this many steps moved less than
+            converge_tolerance (relative) from the window before, see
+            convergence.ConvergenceDetector. The step is kept in converged_at.
+            None only stops at max_iters
+        converge_tolerance: how much the windowed means may move
+        profile: time every phase of step and the main agent methods, see
+            profiling.Profiler. The times are model reporters ("time ...",
+            "time collect", "time avg_agg" and "time log" are those of the
+            step before) and profiler.report() sums them up
+        seed: seed for the model random number generator. Every random draw
+            of the model, the environments and the agents comes from
+            self.random, so the same parameters and seed give the same run
 
     """
 
@@ -55,6 +108,7 @@ class ProtestersVsPolice(Model):
         citizen_vision=7,
         cop_vision=7,
         jail_capacity=50,
+        max_jail_term=None,
         active_threshold=0.9,
         wrap="Wrap around",
         arrest_prob_constant=2.3,
@@ -63,8 +117,28 @@ class ProtestersVsPolice(Model):
         movement=True,
         max_iters=1000,
         funmode=False,
+        engine="agents",
+        run_id=None,
+        log_every=30,
+        collect_window=None,
+        record_every=1,
+        record_breeds=("citizen", "cop"),
+        record_fields=None,
+        park_cops=False,
+        activation="random",
+        converge_window=None,
+        converge_tolerance=0.02,
+        profile=False,
+        seed=None,
+        state=None,
     ):
         super().__init__()
+        self.params = {
+            k: v for k, v in locals().items() if k not in ("self", "__class__", "state")
+        }
+        # mesa keeps the generator on the class, which every new model reseeds
+        self._seed = seed
+        self.random = random.Random(seed)
 
         self.height = height
         self.width = width
@@ -77,143 +151,257 @@ class ProtestersVsPolice(Model):
         self.active_threshold = active_threshold
         self.arrest_prob_constant = arrest_prob_constant
         self.movement = movement
-        self.jailed_agents = []
-        self.arrested_agents = []
-        self.test = 0
+        self.max_jail_term = max_jail_term
+        self.jail = Jail(self, jail_capacity, max_jail_term)
         self.wrap = wrap
         self.max_iters = max_iters
         self.iteration = 0
         self.aggression = self.random.random()
         self.direction_bias = direction_bias
-        self.schedule = RandomActivation(self)
-        self.exp_name = "experiments/experiment-1.txt"
+        if activation == "simultaneous":
+            self.schedule = SimultaneousActivation(self, park_cops)
+        else:
+            self.schedule = BreedActivation(self, park_cops)
+        self.census = Census()
+        self.run_id = run_id or uuid.uuid4().hex
+        self.log_every = log_every
+        self.writer = ExperimentWriter(self.run_id, self.params)
         self.grid = (
-            Grid(height, width, torus=False)
+            TrackedGrid(height, width, torus=False)
             if self.wrap == "Don't wrap around"
-            else Grid(height, width, torus=True)
+            else TrackedGrid(height, width, torus=True)
+        )
+        # radius 1 neighborhoods of every cell, looked up by the agents every step
+        self.neighborhoods = neighborhood_table(
+            self.grid.width, self.grid.height, 1, self.grid.torus
+        )
+        # preferred moves of the citizens on every cell, for direction_bias. The quadrants
+        # are measured on the model's width and height, not the (swapped) grid dims
+        self.flow = flow_field(
+            self.grid.width,
+            self.grid.height,
+            direction_bias,
+            self.grid.torus,
+            bounds=(self.width, self.height),
         )
         self.environment = environment
+        self.engine = engine
+        self.array_engine = None
 
         self.numTotalSpaces = self.height * self.width
         self.numFreeSpaces = (self.height * self.width) * self.grid_density - barricade
         self.numCitizens = self.numFreeSpaces * self.ratio
         self.numCops = self.numFreeSpaces - self.numCitizens
         self.barricade = barricade
-        self.citizen, self.cop, self.block = None, None, None
         self.avg_agg = 0
+        self.jailed_deviants = None
+        self.arrested_deviants = []  # where Deviants were arrested this step
+        self.pursuit = None
 
         model_reporters = {
             "Quiescent": lambda m: self.count_type_citizens(m, "Quiescent"),
             "Active": lambda m: self.count_type_citizens(m, "Active"),
             "Deviant": lambda m: self.count_type_citizens(m, "Deviant"),
-            "Jailed": lambda m: len(self.jailed_agents),
-        }
-        agent_reporters = {
-            "x": lambda a: a.pos[0],
-            "y": lambda a: a.pos[1],
-            "breed": lambda a: a.breed,
-            "jail_sentence": lambda a: getattr(a, "jail_sentence", None),
-            "condition": lambda a: getattr(a, "condition", None),
-            "arrest_probability": lambda a: getattr(a, "arrest_probability", None),
+            "Jailed": lambda m: self.count_in_jail(m),
         }
+        self.profiler = Profiler() if profile else NullProfiler()
+        if profile:
+            for name in reporter_names():
+                model_reporters[f"time {name}"] = (
+                    lambda m, name=name: m.profiler.reported(name)
+                )
         self.datacollector = DataCollector(
-            model_reporters=model_reporters, agent_reporters=agent_reporters
+            model_reporters=model_reporters,
+            window=collect_window,
+            spill=self.writer.write if log_every else None,
         )
-        self.spawner()
+        if state is None:
+            self.spawner()
+        else:
+            load_agents(self, state)
+        if profile:
+            instrument(self.schedule.agents)
+        self.agent_recorder = None
+        if self.array_engine is None and record_every:
+            self.agent_recorder = AgentRecorder(
+                self, record_every, record_breeds, record_fields
+            )
+
+        self.convergence = None
+        self.converged_at = None
+        if converge_window:
+            self.convergence = ConvergenceDetector(converge_window, converge_tolerance)
 
         self.running = True
-        self.datacollector.collect(self)
+        if state is None:
+            self.collect()
+        else:
+            load_progress(self, state)
 
     def spawner(self):
+        """
+        Lay out the environment, then create the agents for it (or hand it to the array engine).
+        """
         self.unique_id = 0
-        if self.environment == "Random distribution":
-            random_strategy(self)
-        elif self.environment == "Block in the middle":
-            middle_block(self, typea="block")
-        elif self.environment == "Cops in the middle":
-            middle_block(self, typea="cop")
-        elif self.environment == "Wall of cops":
-            side_strategy(self, "left", "cop")
-        elif self.environment == "Street":
-            streets(self)
+        layout, risk_aversion = build_layout(self)
+        if self.engine == "compiled" and not KERNEL_AVAILABLE:
+            warnings.warn('numba is not installed, running engine="agents" instead')
+        if self.engine == "array":
+            self.array_engine = ArrayEngine(self, layout, risk_aversion)
+        elif self.engine == "compiled" and KERNEL_AVAILABLE:
+            self.array_engine = SequentialEngine(self, layout, risk_aversion)
+        else:
+            populate(self, layout, risk_aversion)
 
     def step(self):
         """
         Advance the model by one step and collect data.
         """
-        self.schedule.step()
-        for i in self.arrested_agents:
-            if len(self.jailed_agents) < self.jail_capacity:
-                self.jailed_agents.append(i)
-                try:
-                    self.grid._remove_agent(i.pos, i)
-                    self.schedule.remove(i)
-                    self.test += 1
-                    self.arrested_agents.remove(i)
-                except KeyError:
-                    pass
-        self.datacollector.collect(self)
+        profiler = self.profiler
+        if self.array_engine is not None:
+            with profiler.phase("array_engine"):
+                self.array_engine.step()
+        else:
+            self.step_agents()
+        with profiler.phase("collect"):
+            self.collect()
 
         self.iteration += 1
-        self.count_avg_agg()
+        with profiler.phase("avg_agg"):
+            self.count_avg_agg()
         if self.iteration % 3 == 0 and self.funmode == True:
             try:
                 playsound("pewpew.mp3")
             except:
                 pass
 
-        if self.iteration % 30 == 0:
-            df = self.datacollector.get_model_vars_dataframe()
-            df["Environment"] = self.environment
-            df["Ratio"] = self.ratio
-            df["Direction"] = self.direction_bias
-            df["Wrap"] = self.wrap
-            df["Jail Capacity"] = self.jail_capacity
-            df.to_csv(self.experiment_logger(df))
-
         if self.iteration > self.max_iters:
             self.running = False
+        elif self.convergence is not None and self.convergence.update(
+            self.datacollector.model_vars
+        ):
+            self.running = False
+            self.converged_at = self.iteration
 
-    def experiment_logger(self, df):
-        count_f = len(os.listdir("experiments/")) + 1
-        return f"experiments/exp-{str(count_f)}.csv"
+        if self.log_every and (
+            self.iteration % self.log_every == 0 or not self.running
+        ):
+            with profiler.phase("log"):
+                self.write_log()
+        profiler.end_step()
+
+    def write_log(self):
+        """
+        Append the reporter rows not logged yet to experiments/<run_id>.csv, if log_every is set.
+        step does it every log_every steps and when the model stops itself; call it after stepping
+        a model to a step count of your own so the last rows are not left out.
+        """
+        if self.log_every:
+            self.writer.write(
+                self.datacollector.model_vars, self.datacollector.first_step
+            )
+
+    def collect(self):
+        """
+        Collect the model reporters and, when it is due, the agent level data.
+        """
+        self.datacollector.collect(self)
+        if self.agent_recorder is not None:
+            self.agent_recorder.collect(self)
+
+    def step_agents(self):
+        """
+        Activate every agent, then release and lock up citizens, see jail.Jail.
+        """
+        profiler = self.profiler
+        with profiler.phase("fields"):
+            self.count_jailed_deviants()
+            self.build_pursuit_field()
+        with profiler.phase("activation"):
+            self.schedule.step()
+        with profiler.phase("jail"):
+            self.jail.step()
+
+    def count_jailed_deviants(self):
+        """
+        For every cell, count the arrested Deviants still on the grid within citizen_vision
+        (von Neumann, center excluded). Built once per step so each citizen only does a lookup,
+        the arrests made during the step are added as they happen (see arrested_deviant).
+        With simultaneous activation the citizens decide before any cop acts, so they see the Deviants
+        arrested in the step before, wherever they are now.
+        """
+        mask = np.zeros((self.grid.width, self.grid.height), dtype=bool)
+        for agent in self.jail.pending:
+            if agent.condition == "Deviant":
+                mask[agent.pos] = True
+        if isinstance(self.schedule, SimultaneousActivation):
+            for pos in self.arrested_deviants:
+                mask[pos] = True
+        self.arrested_deviants = []
+        self.jailed_deviants = diamond_count(mask, self.citizen_vision, self.grid.torus)
+
+    def arrested_deviant(self, pos):
+        """
+        A Deviant was just arrested at pos: the citizens that step after this see it
+        """
+        self.arrested_deviants.append(pos)
+        if self.jailed_deviants is not None:
+            add_diamond(self.jailed_deviants, pos, self.citizen_vision, self.grid.torus)
+
+    def build_pursuit_field(self):
+        """
+        Distance from every cell to the closest Deviant (or Active) citizen within cop_vision,
+        shared by all cops for the step instead of each of them scanning their vision.
+        """
+        shape = (self.grid.width, self.grid.height)
+        deviants = np.zeros(shape, dtype=bool)
+        actives = np.zeros(shape, dtype=bool)
+        for agent in self.schedule.breed_agents("citizen"):
+            if agent.condition == "Deviant":
+                deviants[agent.pos] = True
+            elif agent.condition == "Active":
+                actives[agent.pos] = True
+        self.pursuit = pursuit_field(
+            deviants, actives, self.cop_vision, self.grid.torus
+        )
 
     @staticmethod
     def count_type_citizens(model, condition, exclude_jailed=True):
         """
         Helper method to count agents by Quiescent/Active.
         """
-        count = 0
-        for agent in model.schedule.agents:
-            if agent.breed == "cop":
-                continue
-            if exclude_jailed and agent.jail_sentence:
-                continue
-            if agent.condition == condition:
-                count += 1
+        if model.array_engine is not None:
+            return model.array_engine.count(condition)
+        count = model.census.conditions[condition]
+        if not exclude_jailed:
+            count += model.census.arrested_conditions[condition]
         return count
 
+    @staticmethod
+    def count_in_jail(model):
+        """
+        Helper method to count the agents taken off the grid into jail.
+        """
+        if model.array_engine is not None:
+            return model.array_engine.jailed
+        return len(model.jail)
+
     @staticmethod
     def count_jailed(model):
         """
         Helper method to count jailed agents.
         """
-        count = 0
-        for agent in model.schedule.agents:
-            if agent.breed == "citizen" and agent.jail_sentence:
-                count += 1
-        return count
+        if model.array_engine is not None:
+            return int(np.count_nonzero(model.array_engine.jail))
+        return model.census.arrested
 
     def count_avg_agg(self):
         """
         Helper method to count avg aggression
         """
-        count = np.array(
-            [
-                agent.aggression
-                for agent in self.schedule.agents
-                if agent.breed == "citizen"
-                and (agent.condition in ["Active", "Deviant"])
-            ]
-        )
-        self.avg_agg = str(round(np.average(count), 4))
+        if self.array_engine is not None:
+            # every citizen is spawned with the model aggression
+            rebels = self.array_engine.count_rebels()
+            self.avg_agg = str(round(self.aggression if rebels else np.nan, 4))
+            return
+        self.avg_agg = str(round(self.census.avg_aggression(), 4))
@@ -0,0 +1,154 @@
+import functools
+from collections import defaultdict
+from contextlib import nullcontext
+from time import perf_counter
+
+# phases of ProtestersVsPolice.step
+PHASES = ("fields", "activation", "jail", "array_engine", "collect", "avg_agg", "log")
+# the phases that finish after the reporters of the step are collected
+AFTER_COLLECT = ("collect", "avg_agg", "log")
+
+# agent methods timed per breed
+METHODS = {
+    "Citizen": (
+        "step",
+        "look_around",
+        "estimate_arrest_probability",
+        "update_aggression_threshold_after_arrest",
+    ),
+    "Cop": ("step", "arrest", "look_around", "move_towards_actives"),
+}
+
+
+class Profiler:
+    """
+    Wall time per step phase and per agent method ("citizen.look_around", ...).
+    Agent method times include the methods they call, so they overlap with each other and with "activation".
+    As reporters (see reported), the phases of AFTER_COLLECT give their time in the step before.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.current = defaultdict(float)  # the step in progress
+        self.last = {}  # the step before
+        self.steps = 0
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def add(self, name, seconds):
+        self.totals[name] += seconds
+        self.calls[name] += 1
+        self.current[name] += seconds
+
+    def end_step(self):
+        self.last = dict(self.current)
+        self.current.clear()
+        self.steps += 1
+
+    def reported(self, name):
+        """
+        Time of a phase or method for the model reporters, collected while the step is still running:
+        the phases that come later in it are taken from the step before
+        """
+        if name in AFTER_COLLECT:
+            return self.last.get(name, 0.0)
+        return self.current.get(name, 0.0)
+
+    def report(self):
+        """
+        Summary table, phases first, then agent methods by total time
+        """
+        step_total = sum(self.totals.get(p, 0.0) for p in PHASES) or 1.0
+        phases = [p for p in PHASES if p in self.totals]
+        methods = sorted(
+            (n for n in self.totals if n not in PHASES), key=lambda n: -self.totals[n]
+        )
+        lines = [
+            f"{self.steps} steps, {step_total:.3f}s",
+            f"{'':50s}{'calls':>10s}{'total s':>10s}{'mean ms':>10s}{'% step':>8s}",
+        ]
+        for name in phases + methods:
+            total, calls = self.totals[name], self.calls[name]
+            lines.append(
+                f"{name:50s}{calls:10d}{total:10.3f}{1000 * total / calls:10.3f}"
+                f"{100 * total / step_total:8.1f}"
+            )
+        return "\n".join(lines)
+
+
+class NullProfiler:
+    """
+    Stand-in when profiling is off: phases are a shared no-op context and agents are not instrumented
+    """
+
+    enabled = False
+    _phase = nullcontext()
+
+    def phase(self, name):
+        return self._phase
+
+    def end_step(self):
+        pass
+
+
+class Phase:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, perf_counter() - self.start)
+
+
+def timed(name, method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.model.profiler.add(name, perf_counter() - start)
+
+    return wrapper
+
+
+_profiled = {}
+
+
+def profiled(cls):
+    """
+    Subclass of an agent class whose METHODS report their time to model.profiler.
+    It adds no fields, so an agent can be switched to it with agent.__class__ = profiled(type(agent)).
+    """
+    if cls not in _profiled:
+        methods = METHODS.get(cls.__name__, ())
+        breed = cls.__name__.lower()
+        namespace = {"__slots__": ()}
+        for method in methods:
+            namespace[method] = timed(f"{breed}.{method}", getattr(cls, method))
+        _profiled[cls] = type(cls.__name__, (cls,), namespace)
+    return _profiled[cls]
+
+
+def instrument(agents):
+    done = set(_profiled.values())
+    for agent in agents:
+        cls = type(agent)
+        if cls.__name__ in METHODS and cls not in done:
+            agent.__class__ = profiled(cls)
+
+
+def reporter_names():
+    names = list(PHASES)
+    for cls, methods in METHODS.items():
+        names += [f"{cls.lower()}.{m}" for m in methods]
+    return names
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+from .engine import CITIZEN, CONDITIONS, COP
+
+BREEDS = {"citizen": CITIZEN, "cop": COP}
+
+# field -> (dtype, value while the agent is off the grid or does not have the field)
+FIELDS = {
+    "x": (np.int16, -1),
+    "y": (np.int16, -1),
+    "breed": (np.int8, -1),
+    "jail_sentence": (np.bool_, False),
+    "condition": (np.int8, -1),
+    "arrest_probability": (np.float32, np.nan),
+}
+
+
+# samples to make room for at first, doubled whenever it runs out
+FIRST_ROWS = 64
+
+
+class AgentRecorder:
+    """
+    Columnar agent level data: one numpy array per field, one row per sample and one column per agent.
+    Room for FIRST_ROWS samples is made up front and doubled whenever it runs out.
+    Samples every `every` steps, only for the chosen breeds and fields. Blocks never change, so they can't be recorded.
+    Breed and condition are stored as the codes of engine.py, use get_agent_vars_dataframe for the strings.
+    """
+
+    def __init__(self, model, every=1, breeds=("citizen", "cop"), fields=None):
+        self.every = every
+        self.fields = list(fields or FIELDS)
+        self.agents = [a for a in model.schedule.agents if a.breed in breeds]
+        self.ids = np.array([a.unique_id for a in self.agents])
+        self.samples = 0
+        self.steps = np.zeros(0, dtype=np.int64)
+        self.present = np.zeros((0, len(self.agents)), dtype=bool)
+        self.data = {
+            f: np.zeros((0, len(self.agents)), FIELDS[f][0]) for f in self.fields
+        }
+        self.grow(min(FIRST_ROWS, model.max_iters // every + 2))
+
+    def grow(self, rows):
+        """
+        Make room for `rows` more samples
+        """
+        n = len(self.agents)
+        self.steps = np.concatenate([self.steps, np.full(rows, -1, dtype=np.int64)])
+        self.present = np.concatenate([self.present, np.zeros((rows, n), dtype=bool)])
+        for f in self.fields:
+            dtype, missing = FIELDS[f]
+            self.data[f] = np.concatenate(
+                [self.data[f], np.full((rows, n), missing, dtype)]
+            )
+
+    def collect(self, model):
+        step = model.schedule.steps
+        if step % self.every:
+            return
+        if self.samples == len(self.steps):
+            self.grow(len(self.steps))
+        row = self.samples
+        self.steps[row] = step
+        self.samples += 1
+
+        on_grid = model.schedule._agents
+        present = [on_grid.get(a.unique_id) is a for a in self.agents]
+        self.present[row] = present
+        agents = [a for a, p in zip(self.agents, present) if p]
+        if not agents:
+            return
+        columns = np.flatnonzero(present)
+        for f in self.fields:
+            self.data[f][row, columns] = [self.value(a, f) for a in agents]
+
+    @staticmethod
+    def value(agent, field):
+        if field == "x":
+            return agent.pos[0]
+        if field == "y":
+            return agent.pos[1]
+        if field == "breed":
+            return BREEDS[agent.breed]
+        if field == "condition":
+            condition = getattr(agent, "condition", None)
+            return CONDITIONS.index(condition) if condition else -1
+        value = getattr(agent, field, None)
+        if field == "arrest_probability" and value is None:
+            return np.nan
+        return value
+
+    def get_agent_vars_dataframe(self):
+        """
+        Like mesa's DataCollector.get_agent_vars_dataframe: indexed by (Step, AgentID), agents off the grid left out
+        """
+        rows, columns = np.nonzero(self.present[: self.samples])
+        df = pd.DataFrame(
+            {f: self.data[f][rows, columns] for f in self.fields},
+            index=pd.MultiIndex.from_arrays(
+                [self.steps[rows], self.ids[columns]], names=["Step", "AgentID"]
+            ),
+        )
+        if "breed" in df:
+            names = {code: name for name, code in BREEDS.items()}
+            df["breed"] = df["breed"].map(names)
+        if "condition" in df:
+            df["condition"] = df["condition"].map(dict(enumerate(CONDITIONS)))
+        return df
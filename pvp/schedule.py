@@ -0,0 +1,180 @@
+import math
+
+import numpy as np
+from mesa.time import RandomActivation
+
+from .engine import ACTIVE, CONDITIONS, DEVIANT, QUIESCENT
+
+
+class BreedActivation(RandomActivation):
+    """
+    RandomActivation with one activation set per breed.
+    Only citizens and cops are shuffled and stepped. Blocks stay in the schedule (agents, counts) but never act.
+    With park_cops, cops on arrest cooldown are left out of the shuffle: until the cooldown ends their step
+    only counts it down (they can't arrest or move), so they just rest().
+    """
+
+    def __init__(self, model, park_cops=False):
+        super().__init__(model)
+        self.park_cops = park_cops
+        self.breeds = {}  # breed -> {unique_id: agent}
+
+    def add(self, agent):
+        super().add(agent)
+        self.breeds.setdefault(agent.breed, {})[agent.unique_id] = agent
+
+    def remove(self, agent):
+        super().remove(agent)
+        del self.breeds[agent.breed][agent.unique_id]
+
+    def breed_agents(self, breed):
+        return list(self.breeds.get(breed, {}).values())
+
+    def active_cops(self):
+        """
+        The cops that step, resting the parked ones
+        """
+        if not self.park_cops:
+            return self.breed_agents("cop")
+        cops = []
+        for cop in self.breed_agents("cop"):
+            if cop.can_arrest or cop.wait_for <= 0:
+                cops.append(cop)
+            else:
+                cop.rest()
+        return cops
+
+    def step(self):
+        actors = self.breed_agents("citizen") + self.active_cops()
+        self.model.random.shuffle(actors)
+        for agent in actors:
+            agent.step()
+        self.steps += 1
+        self.time += 1
+
+
+class SimultaneousActivation(BreedActivation):
+    """
+    Double-buffered activation: every citizen decides its next condition and move on the same frozen board,
+    then all the decisions are applied at once. Two citizens going for the same cell are settled by a shuffled
+    priority order: the first one moves, the others stay where they are.
+    Cops step one by one afterwards, on the updated board, like in BreedActivation.
+
+    The decisions follow the rules of Citizen.step, but are worked out for all citizens together on numpy
+    arrays of the board (see decide). The random draws are made up front on the model generator, so a run
+    only depends on the seed.
+    """
+
+    def __init__(self, model, park_cops=False):
+        super().__init__(model, park_cops)
+        self.probs = None  # arrest probability by cops and actives around, as Citizen.estimate_arrest_probability
+
+    def step(self):
+        rng = self.model.random
+        citizens = self.breed_agents("citizen")
+        rng.shuffle(citizens)  # priority order for contested cells
+        draws = [rng.random() for _ in citizens]
+        decisions = self.decide(citizens, draws)
+
+        claimed = set()
+        for citizen, (condition, threshold, arrest_probability, move) in zip(
+            citizens, decisions
+        ):
+            citizen.threshold = threshold
+            citizen.arrest_probability = arrest_probability
+            citizen.condition = condition
+            if condition == "Active" or condition == "Deviant":
+                citizen.steps_active += 1
+            elif condition == "Quiescent":
+                citizen.steps_active = 0
+            if move is not None and move not in claimed:
+                claimed.add(move)
+                self.model.grid.move_agent(citizen, move)
+
+        cops = self.active_cops()
+        rng.shuffle(cops)
+        for cop in cops:
+            cop.step()
+        self.steps += 1
+        self.time += 1
+
+    def decide(self, citizens, draws):
+        """
+        Next condition, threshold, arrest probability and move of every citizen, read off the board as it is.
+        Changes nothing. draws are uniform numbers in [0, 1), one per citizen, that pick the moves.
+        """
+        model = self.model
+        height = model.grid.height
+        table = model.neighborhoods.index
+        if not citizens:
+            return []
+        if self.probs is None:
+            size = table.shape[1] + 1
+            self.probs = np.array(
+                [
+                    [
+                        1
+                        - math.exp(
+                            -1 * model.arrest_prob_constant * (cops / (1.0 + actives))
+                        )
+                        for actives in range(size)
+                    ]
+                    for cops in range(size)
+                ]
+            )
+
+        # the board, from the citizens (arrested ones included) and the cops and blocks around them
+        at = np.array([c.pos[0] * height + c.pos[1] for c in citizens])
+        risk_aversion = np.array([c.risk_aversion for c in citizens])
+        threshold = np.array([c.threshold for c in citizens])
+        condition = np.array([CONDITIONS.index(c.condition) for c in citizens])
+        arrested = np.array([c.jail_sentence for c in citizens], dtype=bool)
+        occupied = np.zeros(len(table), dtype=bool)
+        cops = np.zeros(len(table), dtype=bool)
+        actives = np.zeros(len(table), dtype=bool)
+        occupied[at] = True
+        actives[at[(condition == ACTIVE) & ~arrested]] = True
+        for breed, mask in (("cop", cops), ("Block", occupied)):
+            positions = np.array([a.pos for a in self.breeds.get(breed, {}).values()])
+            if len(positions):
+                mask[positions[:, 0] * height + positions[:, 1]] = True
+        occupied |= cops
+
+        around = table[at]
+        valid = around >= 0
+        around = np.where(valid, around, 0)
+        probability = self.probs[
+            np.count_nonzero(cops[around] & valid, axis=1),
+            np.count_nonzero(actives[around] & valid, axis=1),
+        ]
+        condition[risk_aversion < 0.05] = DEVIANT
+        seen = model.jailed_deviants.reshape(-1)[at] > 0
+        threshold = np.where(seen, threshold / 2, threshold)
+        calm = np.abs(risk_aversion * probability - probability) <= threshold
+        quiescent = condition == QUIESCENT
+        condition[quiescent & ~calm] = ACTIVE
+        condition[~quiescent & calm] = QUIESCENT
+
+        moves = [None] * len(citizens)
+        if model.movement:
+            options = ~occupied[around] & valid
+            if model.direction_bias != "Random":
+                preferred = options & model.flow.index[at]
+                options = np.where(preferred.any(axis=1)[:, None], preferred, options)
+            count = np.count_nonzero(options, axis=1)
+            # the option a draw picks, as options[int(u * len(options))]
+            pick = (np.array(draws) * count).astype(np.int64)
+            col = np.argmax(np.cumsum(options, axis=1) > pick[:, None], axis=1)
+            targets = around[np.arange(len(citizens)), col]
+            movers = np.flatnonzero(count)
+            for i, cell in zip(movers.tolist(), targets[movers].tolist()):
+                moves[i] = divmod(cell, height)
+
+        return list(
+            zip(
+                [CONDITIONS[c] for c in condition.tolist()],
+                threshold.tolist(),
+                probability.tolist(),
+                moves,
+            )
+        )
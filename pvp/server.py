@@ -35,7 +35,7 @@ def citizen_cop_portrayal(agent):
         "Filled": "true",
     }
 
-    if type(agent) is Citizen:
+    if isinstance(agent, Citizen):
         color = (
             AGENT_QUIET_COLOR if agent.condition == "Quiescent" else AGENT_REBEL_COLOR
         )
@@ -45,14 +45,14 @@ def citizen_cop_portrayal(agent):
         portrayal["r"] = 0.8
         portrayal["Layer"] = 0
 
-    elif type(agent) is Block:
+    elif isinstance(agent, Block):
         portrayal["Shape"] = "rect"
         portrayal["Color"] = BARRICADE_COLOR
         portrayal["h"] = 0.9
         portrayal["w"] = 0.9
         portrayal["Layer"] = 0
 
-    elif type(agent) is Cop:
+    elif isinstance(agent, Cop):
         color = COP_COLOR if agent.can_arrest else COP_ARRESTING_COLOR
         portrayal["Color"] = color
         portrayal["r"] = 0.5
@@ -129,6 +129,8 @@ model_params = {
     "cop_vision": 7,
     "barricade": 50,
     "funmode": False,  # Set to True for sound effects
+    "collect_window": 1000,  # the chart only needs the latest step, keep memory flat
+    "record_every": None,
 }
 
 
@@ -141,18 +143,11 @@ class AgentLeftElement(TextElement):
         pass
 
     def render(self, model):
-        cop = 0
-        citizen = 0
-        block = 0
-        for agent in model.schedule.agents:
-            if agent.breed == "citizen":
-                citizen += 1
-            if agent.breed == "cop":
-                cop += 1
-            if agent.breed == "Block":
-                block += 1
-
-        stats = f"""Number of citizens: {str(citizen)}, Number of jailed citizens: {str(len(model.jailed_agents))}, \n Number of cops: {str(cop)}, Number of blocks: {str(block)}, \n Average Aggression: {model.avg_agg}"""  # FIXME New lines somehow don't work?
+        cop = model.census.breeds["cop"]
+        citizen = model.census.breeds["citizen"]
+        block = model.census.breeds["Block"]
+
+        stats = f"""Number of citizens: {str(citizen)}, Number of jailed citizens: {str(model.count_in_jail(model))}, \n Number of cops: {str(cop)}, Number of blocks: {str(block)}, \n Average Aggression: {model.avg_agg}"""  # FIXME New lines somehow don't work?
         return stats
 
 
@@ -0,0 +1,265 @@
+import functools
+
+import numpy as np
+
+# von Neumann radius 1 offsets, in the same order mesa sorts them for a cell
+# away from the border: left, up, down, right
+OFFSETS = ((-1, 0), (0, -1), (0, 1), (1, 0))
+
+
+def shift(a, dx, dy, torus, fill=0):
+    """
+    Look dx, dy cells away on the last two axes (x, y) of a.
+    out[..., x, y] = a[..., x + dx, y + dy], wrapped on a torus and `fill` off the edge otherwise
+    """
+    if torus:
+        return np.roll(a, (-dx, -dy), axis=(-2, -1))
+    out = np.full_like(a, fill)
+    w, h = a.shape[-2:]
+    src_x = slice(max(dx, 0), w + min(dx, 0))
+    dst_x = slice(max(-dx, 0), w + min(-dx, 0))
+    src_y = slice(max(dy, 0), h + min(dy, 0))
+    dst_y = slice(max(-dy, 0), h + min(-dy, 0))
+    out[..., dst_x, dst_y] = a[..., src_x, src_y]
+    return out
+
+
+def neighbor_count(mask, torus):
+    """
+    Number of True cells in the radius 1 von Neumann neighborhood of every cell (center excluded)
+    """
+    mask = mask.astype(np.int32)
+    return sum(shift(mask, dx, dy, torus) for dx, dy in OFFSETS)
+
+
+def diamond_count(mask, radius, torus):
+    """
+    Number of True cells within manhattan distance `radius` of every cell (center excluded).
+    Built from column prefix sums: the diamond is a stack of vertical windows, one per dx.
+    On a torus smaller than the diamond the count can include a cell twice, so only use it as a count > 0 test there.
+    """
+    a = mask.astype(np.int32)
+    w, h = a.shape[-2:]
+    pad = [(0, 0)] * (a.ndim - 2) + [(radius, radius), (radius, radius)]
+    padded = np.pad(a, pad, mode="wrap" if torus else "constant")
+    csum = np.zeros(padded.shape[:-1] + (padded.shape[-1] + 1,), dtype=np.int32)
+    np.cumsum(padded, axis=-1, out=csum[..., 1:])
+
+    out = np.zeros_like(a)
+    for dx in range(-radius, radius + 1):
+        k = radius - abs(dx)
+        cols = csum[..., radius + dx : radius + dx + w, :]
+        out += (
+            cols[..., radius + k + 1 : radius + k + 1 + h]
+            - cols[..., radius - k : radius - k + h]
+        )
+    return out - a
+
+
+@functools.lru_cache(maxsize=None)
+def diamond_offsets(radius):
+    """
+    dx, dy arrays of the cells within manhattan distance radius (center excluded)
+    """
+    offsets = [
+        (dx, dy)
+        for dx in range(-radius, radius + 1)
+        for dy in range(-(radius - abs(dx)), radius - abs(dx) + 1)
+        if dx or dy
+    ]
+    # intp keeps them usable as indices when radius is 0 and there are none
+    dx = np.array([o[0] for o in offsets], dtype=np.intp)
+    dy = np.array([o[1] for o in offsets], dtype=np.intp)
+    return dx, dy
+
+
+def add_diamond(counts, pos, radius, torus):
+    """
+    Add one True cell at pos to counts, a diamond_count grid, in place: O(radius**2) instead of a recount
+    """
+    dx, dy = diamond_offsets(radius)
+    w, h = counts.shape
+    x, y = pos[0] + dx, pos[1] + dy
+    if torus:
+        x, y = x % w, y % h
+    else:
+        inside = (0 <= x) & (x < w) & (0 <= y) & (y < h)
+        x, y = x[inside], y[inside]
+    np.add.at(counts, (x, y), 1)
+
+
+def distance_field(mask, radius, torus):
+    """
+    Manhattan distance from every cell to the nearest True cell, capped at radius + 1 (nothing in sight)
+    """
+    far = radius + 1
+    dist = np.where(mask, 0, far).astype(np.int32)
+    for _ in range(radius):
+        nearest = dist
+        for dx, dy in OFFSETS:
+            nearest = np.minimum(nearest, shift(dist, dx, dy, torus, fill=far) + 1)
+        dist = nearest
+    return np.minimum(dist, far)
+
+
+def pursuit_field(deviants, actives, radius, torus):
+    """
+    Distance a cop has to close to reach a Deviant within radius, or an Active if no Deviant is in reach.
+    Cells with nothing in reach get radius + 1.
+    """
+    to_deviant = distance_field(deviants, radius, torus)
+    to_active = distance_field(actives, radius, torus)
+    return np.where(to_deviant <= radius, to_deviant, to_active)
+
+
+class NeighborhoodTable:
+    """
+    The von Neumann neighborhood (center excluded) of every cell of a width x height grid, worked out once.
+    index is a (width * height, size) array of flat cell numbers (x * height + y), padded with -1 where a
+    border cell has fewer neighbors. table[x, y] is the same neighborhood as a list of (x, y), in the order
+    mesa's grid.get_neighborhood gives it, so agents can look it up instead of asking the grid every step.
+    """
+
+    def __init__(self, width, height, radius, torus):
+        self.width = width
+        self.height = height
+        self.radius = radius
+        self.torus = torus
+
+        offsets = [
+            (dx, dy)
+            for dy in range(-radius, radius + 1)
+            for dx in range(-radius, radius + 1)
+            if (dx or dy) and abs(dx) + abs(dy) <= radius
+        ]
+        x, y = np.meshgrid(np.arange(width), np.arange(height), indexing="ij")
+        x, y = x.reshape(-1, 1), y.reshape(-1, 1)
+        nx = x + np.array([dx for dx, _ in offsets])
+        ny = y + np.array([dy for _, dy in offsets])
+        cells = width * height
+        if torus:
+            flat = (nx % width) * height + ny % height
+        else:
+            inside = (0 <= nx) & (nx < width) & (0 <= ny) & (ny < height)
+            flat = np.where(inside, nx * height + ny, cells)
+        # sorting flat numbers sorts (x, y) tuples, like mesa does; on a small torus
+        # cells can wrap onto each other, so drop the repeats
+        flat = np.sort(flat, axis=1)
+        flat[:, 1:][flat[:, 1:] == flat[:, :-1]] = cells
+        flat = np.sort(flat, axis=1)
+        size = int((flat < cells).sum(axis=1).max())
+        self.index = np.where(flat < cells, flat, -1)[:, :size]
+
+        positions = np.empty(cells + 1, dtype=object)
+        positions[:cells] = [(i // height, i % height) for i in range(cells)]
+        rows = positions[flat[:, :size]].tolist()
+        for i in np.flatnonzero(self.index[:, -1] < 0).tolist():
+            rows[i] = [pos for pos in rows[i] if pos is not None]
+        self.cells = [rows[i * height : (i + 1) * height] for i in range(width)]
+
+    def __getitem__(self, pos):
+        x, y = pos
+        return self.cells[x][y]
+
+
+@functools.lru_cache(maxsize=8)
+def neighborhood_table(width, height, radius, torus):
+    """
+    Shared NeighborhoodTable, so models on the same grid (batch runs, forks) build it only once
+    """
+    return NeighborhoodTable(width, height, radius, torus)
+
+
+def biased(x, y, nx, ny, bounds, bias):
+    """
+    Whether the moves from cells x, y to their neighbors nx, ny follow direction_bias, see
+    Citizen.preferred_moves. Arrays broadcast, "Random" (or any other bias) prefers no move.
+    bounds is the (width, height) the vortex quadrants are measured on: like preferred_moves does,
+    x is compared with the model's width and y with its height.
+    """
+    up = (ny < y) & (nx == x)
+    down = (ny > y) & (nx == x)
+    right = (ny == y) & (nx > x)
+    left = (ny == y) & (nx < x)
+    directions = {"up": up, "down": down, "left": left, "right": right}
+
+    if bias not in ("Clockwise", "Anti-clockwise"):
+        return directions.get(bias, np.zeros_like(up))
+
+    # a vortex around the middle: each quadrant has one way to go
+    width, height = bounds
+    x_left = (width / 2) - 5
+    y_up = (height / 2) - 5
+    x_right = width - x_left
+    y_down = height - y_up
+    quadrants = (
+        (x < x_left) & (y > y_up),
+        (x < x_right) & (y < y_up),
+        (x > x_right) & (y < y_down),
+        (x > x_left) & (y > y_down),
+    )
+    if bias == "Anti-clockwise":
+        ways = (up, right, down, left)
+    else:
+        ways = (down, left, up, right)
+    preferred = np.zeros_like(up)
+    for quadrant, way in zip(quadrants, ways):
+        preferred |= quadrant & way
+    return preferred
+
+
+class FlowField:
+    """
+    The neighbors a citizen with direction_bias prefers to move to, for every cell of a width x height grid,
+    worked out once, so a biased move is a lookup instead of a direction test per candidate.
+    offsets is a (width, height, 4) mask over OFFSETS (for the array engines), index a mask lined up with
+    NeighborhoodTable.index and table[x, y] the preferred cells as a list of (x, y), in mesa's order.
+    bounds is what biased measures the quadrants on, the grid's width and height unless given:
+    the model builds its grid as Grid(height, width), so the two are swapped there.
+    """
+
+    def __init__(self, width, height, bias, torus, bounds=None):
+        self.width = width
+        self.height = height
+        self.bias = bias
+        self.torus = torus
+        self.bounds = bounds = bounds or (width, height)
+
+        x, y = np.meshgrid(np.arange(width), np.arange(height), indexing="ij")
+        x, y = x[..., None], y[..., None]
+        nx = x + np.array([dx for dx, _ in OFFSETS])
+        ny = y + np.array([dy for _, dy in OFFSETS])
+        if torus:
+            nx, ny = nx % width, ny % height
+        else:
+            # off the board moves never count, ArrayEngine.neighbors masks them out
+            nx, ny = np.clip(nx, 0, width - 1), np.clip(ny, 0, height - 1)
+        self.offsets = biased(x, y, nx, ny, bounds, bias)
+
+        neighborhoods = neighborhood_table(width, height, 1, torus)
+        flat = np.arange(width * height)[:, None]
+        around = neighborhoods.index
+        x, y = flat // height, flat % height
+        nx, ny = around // height, around % height
+        self.index = (around >= 0) & biased(x, y, nx, ny, bounds, bias)
+
+        keep = self.index.tolist()
+        self.cells = [
+            [
+                [pos for pos, k in zip(cells, keep[i * height + j]) if k]
+                for j, cells in enumerate(column)
+            ]
+            for i, column in enumerate(neighborhoods.cells)
+        ]
+
+    def __getitem__(self, pos):
+        x, y = pos
+        return self.cells[x][y]
+
+
+@functools.lru_cache(maxsize=8)
+def flow_field(width, height, bias, torus, bounds=None):
+    """
+    Shared FlowField, built once per grid, direction_bias and bounds
+    """
+    return FlowField(width, height, bias, torus, bounds)
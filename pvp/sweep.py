@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing, contextmanager
+
+import pandas as pd
+
+from . import checkpoint
+from .batch import cached, make_jobs, new_model, store, summarize, to_frame
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    run INTEGER NOT NULL,
+    params TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    max_steps INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    snapshot BLOB,
+    result TEXT,
+    error TEXT
+)
+"""
+STATUSES = ("pending", "running", "done", "failed")
+
+
+class LeaseLost(Exception):
+    """
+    Another worker took over the job, after the lease ran out
+    """
+
+
+class Sweep:
+    """
+    A parameter sweep as a queue of (params, seed) jobs in a SQLite file, that any number of worker processes,
+    on this machine or on others sharing the file, drain together (work, or run for a local pool).
+
+    A worker claims a job under a lease of `lease` seconds and renews it while the run goes on. A job whose
+    worker died is claimed again once its lease ran out. Every `checkpoint_every` steps the model is
+    snapshotted into the job (see checkpoint.snapshot), so the next worker carries on from there instead of
+    from step 0, with the same result. A run that raises goes back in the queue until it was tried
+    max_attempts times, then it is failed (retry puts failed jobs back). Results are kept with their job, so
+    adding the same sweep again after a crash or reboot only leaves the unfinished jobs to run.
+    """
+
+    def __init__(self, path, lease=600, max_attempts=3, checkpoint_every=None):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.checkpoint_every = checkpoint_every
+        with self.transaction() as db:
+            db.execute(SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        """
+        A connection inside a write transaction, so claims by different workers can't interleave.
+        The journal stays in the default rollback mode, which also works on shared network drives.
+        """
+        with closing(
+            sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        ) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def add(self, param_sets, replicates=1, max_steps=500, seed=0):
+        """
+        Queue one job per parameter set and replicate, seeded like batch.make_jobs and numbered on from the
+        runs already in the sweep. Jobs that are already in the sweep are left as they are.
+        Returns how many jobs were added.
+        """
+        rows = []
+        for _, params, job_seed in make_jobs(param_sets, replicates, seed):
+            text = json.dumps(params, sort_keys=True)
+            key = hashlib.sha256(f"{text}|{job_seed}|{max_steps}".encode()).hexdigest()
+            rows.append((key, json.dumps(params), job_seed))
+        with self.transaction() as db:
+            (run,) = db.execute("SELECT COALESCE(MAX(run) + 1, 0) FROM jobs").fetchone()
+            added = 0
+            for key, text, job_seed in rows:
+                cursor = db.execute(
+                    "INSERT OR IGNORE INTO jobs (key, run, params, seed, max_steps) VALUES (?, ?, ?, ?, ?)",
+                    (key, run + added, text, job_seed, max_steps),
+                )
+                added += cursor.rowcount
+            return added
+
+    def claim(self, worker):
+        """
+        Take the next pending job, or one whose lease ran out, None if there is none
+        """
+        now = time.time()
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'failed', error = 'lease ran out', worker = NULL"
+                " WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )
+            row = db.execute(
+                "SELECT id, run, params, seed, max_steps, snapshot FROM jobs"
+                " WHERE status = 'pending' OR (status = 'running' AND lease_until < ?)"
+                " ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1"
+                " WHERE id = ?",
+                (worker, now + self.lease, row[0]),
+            )
+        job_id, run, params, seed, max_steps, snapshot = row
+        return {
+            "id": job_id,
+            "run": run,
+            "params": json.loads(params),
+            "seed": seed,
+            "max_steps": max_steps,
+            "snapshot": snapshot,
+        }
+
+    def update(self, job, worker, sql, values=()):
+        """
+        Change a job this worker holds the lease of, raise LeaseLost if it doesn't anymore
+        """
+        with self.transaction() as db:
+            cursor = db.execute(
+                f"UPDATE jobs SET {sql} WHERE id = ? AND worker = ? AND status = 'running'",
+                (*values, job["id"], worker),
+            )
+            if cursor.rowcount == 0:
+                raise LeaseLost(job["id"])
+
+    def renew(self, job, worker, snapshot=None):
+        if snapshot is None:
+            self.update(job, worker, "lease_until = ?", (time.time() + self.lease,))
+        else:
+            self.update(
+                job,
+                worker,
+                "lease_until = ?, snapshot = ?",
+                (time.time() + self.lease, snapshot),
+            )
+
+    def complete(self, job, worker, result):
+        stored = {k: v for k, v in result.items() if k not in ("run", "params")}
+        text = json.dumps(stored, default=lambda value: value.item())
+        self.update(
+            job,
+            worker,
+            "status = 'done', result = ?, snapshot = NULL, error = NULL, lease_until = NULL",
+            (text,),
+        )
+
+    def fail(self, job, worker, error):
+        self.update(
+            job,
+            worker,
+            "status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+            " error = ?, lease_until = NULL",
+            (self.max_attempts, error),
+        )
+
+    def run_job(self, job, worker, cache=None):
+        """
+        batch.run_job for a claimed job, from its last snapshot if it has one, renewing the lease as it goes
+        """
+        run, params, seed, max_steps = (
+            job["run"],
+            job["params"],
+            job["seed"],
+            job["max_steps"],
+        )
+        found = cached((run, params, seed), max_steps, cache)
+        if found:
+            return found[0]
+        if job["snapshot"] is not None:
+            model = checkpoint.restore(job["snapshot"])
+        else:
+            model = new_model(params, seed)
+        renewed = time.time()
+        while model.running and model.iteration < max_steps:
+            model.step()
+            if self.checkpoint_every and model.iteration % self.checkpoint_every == 0:
+                self.renew(job, worker, checkpoint.snapshot(model))
+                renewed = time.time()
+            elif time.time() - renewed > self.lease / 3:
+                self.renew(job, worker)
+                renewed = time.time()
+        model.write_log()
+        result = summarize(model, run, params, seed)
+        store(result, max_steps, cache)
+        return result
+
+    def work(self, worker=None, cache=None):
+        """
+        Run jobs until there are none left to claim, returns how many this worker finished.
+        A job another worker still holds a live lease on is left to it.
+        """
+        worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        finished = 0
+        while True:
+            job = self.claim(worker)
+            if job is None:
+                return finished
+            try:
+                result = self.run_job(job, worker, cache)
+                self.complete(job, worker, result)
+                finished += 1
+            except LeaseLost:
+                continue
+            except Exception:
+                try:
+                    self.fail(job, worker, traceback.format_exc())
+                except LeaseLost:
+                    pass
+
+    def run(self, workers=None, cache=None):
+        """
+        Drain the queue with a pool of worker processes on this machine, returns status()
+        """
+        workers = workers or os.cpu_count()
+        if workers == 1:
+            self.work(cache=cache)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for future in [
+                    pool.submit(self.work, None, cache) for _ in range(workers)
+                ]:
+                    future.result()
+        return self.status()
+
+    def retry(self):
+        """
+        Put the failed jobs back in the queue with a fresh set of attempts, returns how many
+        """
+        with self.transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0 WHERE status = 'failed'"
+            )
+            return cursor.rowcount
+
+    def status(self):
+        """
+        Number of jobs by status
+        """
+        with self.transaction() as db:
+            counts = dict(
+                db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+            )
+        return {status: counts.get(status, 0) for status in STATUSES}
+
+    def errors(self):
+        """
+        The last error of every job that has one, by run
+        """
+        with self.transaction() as db:
+            rows = db.execute(
+                "SELECT run, error FROM jobs WHERE error IS NOT NULL ORDER BY run"
+            ).fetchall()
+        return dict(rows)
+
+    def results(self):
+        """
+        The results of the finished jobs, like batch.run_job gives them
+        """
+        with self.transaction() as db:
+            rows = db.execute(
+                "SELECT run, params, result FROM jobs WHERE status = 'done' ORDER BY run"
+            ).fetchall()
+        return [
+            {**json.loads(result), "run": run, "params": json.loads(params)}
+            for run, params, result in rows
+        ]
+
+    def frame(self):
+        """
+        Tidy table of the finished jobs, like batch.run_batch
+        """
+        frames = [to_frame(result) for result in self.results()]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True).sort_values(
+            ["run", "step"], ignore_index=True
+        )
@@ -0,0 +1,46 @@
+import csv
+import json
+import os
+
+
+class ExperimentWriter:
+    """
+    Streams the model reporter rows of one run to <directory>/<run_id>.csv.
+    Only rows that were not written before are appended, and the run metadata
+    (environment, ratio, ...) goes once into <directory>/<run_id>.json.
+    """
+
+    def __init__(self, run_id, metadata, directory="experiments"):
+        self.run_id = run_id
+        self.metadata = metadata
+        self.directory = directory
+        self.path = os.path.join(directory, f"{run_id}.csv")
+        self.meta_path = os.path.join(directory, f"{run_id}.json")
+        self.written = 0  # rows already on disk
+
+    def write(self, model_vars, first_step=0):
+        """
+        Append the rows of model_vars (reporter name -> list of values) that are not on disk yet.
+        model_vars[name][0] is step first_step, when the collector only keeps a window of recent steps.
+        """
+        columns = list(model_vars)
+        total = first_step + len(model_vars[columns[0]]) if columns else 0
+        if total <= self.written:
+            return
+        if self.written == 0:
+            self.start(columns)
+        with open(self.path, "a", newline="") as f:
+            writer = csv.writer(f)
+            for step in range(max(self.written, first_step), total):
+                row = [model_vars[c][step - first_step] for c in columns]
+                writer.writerow([step] + row)
+        self.written = total
+
+    def start(self, columns):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.meta_path, "w") as f:
+            json.dump(
+                {**self.metadata, "run_id": self.run_id}, f, indent=2, default=str
+            )
+        with open(self.path, "w", newline="") as f:
+            csv.writer(f).writerow(["step"] + columns)
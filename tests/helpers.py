@@ -0,0 +1,44 @@
+import pytest
+
+from pvp.kernel import AVAILABLE as KERNEL_AVAILABLE
+from pvp.model import ProtestersVsPolice
+
+needs_numba = pytest.mark.skipif(not KERNEL_AVAILABLE, reason="needs numba")
+
+# a few boards, small enough to run in a moment, with arrests and releases going on
+SETUPS = [
+    {"ratio": 0.7, "jail_capacity": 500},
+    {
+        "ratio": 0.5,
+        "wrap": "Don't wrap around",
+        "direction_bias": "Clockwise",
+        "max_jail_term": 10,
+    },
+    {
+        "environment": "Street",
+        "ratio": 0.6,
+        "direction_bias": "up",
+        "jail_capacity": 20,
+        "max_jail_term": 5,
+    },
+    {"environment": "Wall of cops", "ratio": 0.3, "park_cops": True},
+    {"ratio": 0.6, "height": 6, "width": 6, "citizen_vision": 7},
+    {"ratio": 0.5, "height": 20, "width": 40, "direction_bias": "Clockwise"},
+]
+
+
+def make(seed=3, **params):
+    params = {
+        "height": 25,
+        "width": 25,
+        "log_every": None,
+        "record_every": None,
+        **params,
+    }
+    return ProtestersVsPolice(**params, seed=seed)
+
+
+def run(model, steps):
+    for _ in range(steps):
+        model.step()
+    return model.datacollector.get_model_vars_dataframe()
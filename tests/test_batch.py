@@ -0,0 +1,24 @@
+from pvp.batch import run_batch
+
+
+def test_batch_does_not_depend_on_workers():
+    params = [
+        {"height": 20, "width": 20, "max_iters": 40, "log_every": None, "ratio": r}
+        for r in (0.1, 0.5)
+    ]
+    one = run_batch(params, replicates=2, max_steps=40, workers=1)
+    two = run_batch(params, replicates=2, max_steps=40, workers=2)
+    assert one.equals(two)
+
+
+def test_batch_logs_only_when_asked(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    params = {"height": 20, "width": 20, "ratio": 0.5}
+    run_batch(params, max_steps=40, workers=1)
+    assert not (tmp_path / "experiments").exists()
+
+    # steps after the last multiple of log_every are written too
+    frame = run_batch({**params, "log_every": 30}, max_steps=40, workers=1)
+    (log,) = (tmp_path / "experiments").glob("*.csv")
+    rows = log.read_text().splitlines()[1:]
+    assert len(rows) == len(frame)
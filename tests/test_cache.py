@@ -0,0 +1,15 @@
+from pvp.batch import run_batch
+from pvp.cache import ResultCache
+
+
+def test_ensemble_cache_entries_are_not_agents_runs(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    params = [
+        {"height": 20, "width": 20, "max_iters": 40, "log_every": None, "ratio": 0.5}
+    ]
+    ensemble = run_batch(
+        params, replicates=2, max_steps=40, workers=1, ensemble=True, cache=cache
+    )
+    agents = run_batch(params, replicates=2, max_steps=40, workers=1, cache=cache)
+    assert agents.equals(run_batch(params, replicates=2, max_steps=40, workers=1))
+    assert not agents.equals(ensemble)
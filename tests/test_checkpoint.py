@@ -0,0 +1,40 @@
+import pytest
+
+from pvp import checkpoint
+
+from .helpers import SETUPS, make, needs_numba, run
+
+
+@pytest.mark.parametrize(
+    "engine",
+    [
+        {"engine": "agents"},
+        {"engine": "agents", "activation": "simultaneous"},
+        {"engine": "array"},
+        pytest.param({"engine": "compiled"}, marks=needs_numba),
+    ],
+)
+@pytest.mark.parametrize("params", SETUPS[:2])
+def test_restore_carries_on_like_the_original(engine, params):
+    original = make(**params, **engine)
+    run(original, 30)
+    data = checkpoint.snapshot(original)
+    expected = run(original, 30)
+    restored = checkpoint.restore(data)
+    assert run(restored, 30).equals(expected)
+    assert restored.random.getstate() == original.random.getstate()
+
+
+def test_max_jail_term_cant_be_set_on_a_snapshot_without_one():
+    model = make(ratio=0.7, jail_capacity=500)
+    run(model, 10)
+    data = checkpoint.snapshot(model)
+    with pytest.raises(ValueError):
+        checkpoint.restore(data, max_jail_term=4)
+    # shortening a term is fine
+    model = make(ratio=0.7, max_jail_term=10)
+    run(model, 10)
+    assert (
+        checkpoint.restore(checkpoint.snapshot(model), max_jail_term=4).max_jail_term
+        == 4
+    )
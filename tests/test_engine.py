@@ -0,0 +1,20 @@
+import pytest
+
+from .helpers import SETUPS, make, run
+
+
+@pytest.mark.parametrize("params", SETUPS)
+def test_array_engine_runs_are_reproducible(params):
+    first = make(**params, engine="array")
+    second = make(**params, engine="array")
+    assert run(first, 40).equals(run(second, 40))
+
+
+@pytest.mark.parametrize("params", SETUPS)
+def test_array_engine_keeps_every_citizen(params):
+    model = make(**params, engine="array")
+    df = run(model, 40)
+    # free on the board (Blocks count as Quiescent), in jail or arrested and waiting for it
+    totals = df[["Quiescent", "Active", "Deviant", "Jailed"]].sum(axis=1)
+    waiting = model.array_engine.jail.sum()
+    assert totals.iloc[-1] + waiting == totals.iloc[0]
@@ -0,0 +1,15 @@
+import pytest
+
+from pvp.ensemble import run_ensemble
+
+from .helpers import SETUPS, make, run
+
+
+@pytest.mark.parametrize("params", SETUPS[:3])
+def test_ensemble_matches_array(params):
+    params = {"height": 25, "width": 25, "max_iters": 60, **params}
+    ensemble = run_ensemble(params, 3, max_steps=60, seed=10)
+    for i, result in enumerate(ensemble):
+        single = run(make(seed=10 + i, **params, engine="array"), 60)
+        for name, series in result["series"].items():
+            assert series == single[name].tolist()
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from pvp.engine import CITIZEN
+
+from .helpers import make, needs_numba, run
+
+
+def halved(model):
+    """
+    Citizens on the grid whose threshold was halved after seeing an arrested Deviant
+    """
+    engine = model.array_engine
+    if engine is None:
+        citizens = model.schedule.breed_agents("citizen")
+        return sum(c.threshold < model.active_threshold for c in citizens)
+    on_grid = engine.breed == CITIZEN
+    if hasattr(engine, "pos"):  # kernel.SequentialEngine
+        on_grid &= engine.pos >= 0
+    return int(np.count_nonzero(on_grid & (engine.threshold < model.active_threshold)))
+
+
+@pytest.mark.parametrize(
+    "engine",
+    [
+        {"engine": "agents"},
+        {"engine": "agents", "activation": "simultaneous"},
+        {"engine": "array"},
+        pytest.param({"engine": "compiled"}, marks=needs_numba),
+    ],
+)
+def test_arrested_deviants_halve_thresholds(engine):
+    # the jail has room, so arrestees are taken off the grid the step they are arrested
+    model = make(height=30, width=30, ratio=0.7, jail_capacity=500, **engine)
+    run(model, 60)
+    assert halved(model) > 0
+
+
+@pytest.mark.parametrize("vision", [{"citizen_vision": 0}, {"cop_vision": 0}])
+@pytest.mark.parametrize(
+    "engine",
+    [
+        {"engine": "agents"},
+        {"engine": "agents", "activation": "simultaneous"},
+        {"engine": "agents", "environment": "Wall of cops", "park_cops": True},
+        {"engine": "array"},
+        pytest.param({"engine": "compiled"}, marks=needs_numba),
+    ],
+)
+def test_arrests_with_no_vision(engine, vision):
+    model = make(ratio=0.7, jail_capacity=500, **engine, **vision)
+    df = run(model, 20)
+    assert df["Jailed"].iloc[-1] > 0
+    if "citizen_vision" in vision:
+        # nobody sees an arrest, so no threshold is halved
+        assert halved(model) == 0
@@ -0,0 +1,12 @@
+import pytest
+
+from .helpers import SETUPS, make, needs_numba, run
+
+
+@needs_numba
+@pytest.mark.parametrize("params", SETUPS)
+def test_compiled_matches_agents(params):
+    agents = make(**params)
+    compiled = make(**params, engine="compiled")
+    assert run(agents, 60).equals(run(compiled, 60))
+    assert agents.random.getstate() == compiled.random.getstate()
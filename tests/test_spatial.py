@@ -0,0 +1,61 @@
+import pytest
+
+from pvp.spatial import OFFSETS
+
+from .helpers import make
+
+
+def direction(pos, new_pos):
+    if new_pos[1] < pos[1] and new_pos[0] == pos[0]:
+        return "up"
+    if new_pos[1] > pos[1] and new_pos[0] == pos[0]:
+        return "down"
+    if new_pos[1] == pos[1] and new_pos[0] > pos[0]:
+        return "right"
+    if new_pos[1] == pos[1] and new_pos[0] < pos[0]:
+        return "left"
+    return None
+
+
+def preferred(model, pos, moves):
+    """
+    The vortex rule as Citizen.choose_direction had it before the flow field: x against the
+    model's width, y against its height
+    """
+    x_left = (model.width / 2) - 5
+    y_up = (model.height / 2) - 5
+    x_right = model.width - x_left
+    y_down = model.height - y_up
+    x, y = pos
+    quadrants = (
+        (x < x_left and y > y_up, "up", "down"),
+        (x < x_right and y < y_up, "right", "left"),
+        (x > x_right and y < y_down, "down", "up"),
+        (x > x_left and y > y_down, "left", "right"),
+    )
+    ways = {
+        way if model.direction_bias == "Anti-clockwise" else other
+        for inside, way, other in quadrants
+        if inside
+    }
+    return [move for move in moves if direction(pos, move) in ways]
+
+
+@pytest.mark.parametrize("bias", ["Clockwise", "Anti-clockwise"])
+@pytest.mark.parametrize("wrap", ["Wrap around", "Don't wrap around"])
+@pytest.mark.parametrize("height, width", [(20, 40), (40, 24)])
+def test_flow_field_on_non_square_boards(height, width, wrap, bias):
+    model = make(height=height, width=width, wrap=wrap, direction_bias=bias)
+    grid, flow = model.grid, model.flow
+    for x in range(grid.width):
+        for y in range(grid.height):
+            moves = grid.get_neighborhood((x, y), moore=False, radius=1)
+            expected = preferred(model, (x, y), moves)
+            assert flow[x, y] == expected
+            # the array engines' mask over OFFSETS picks the same cells
+            picked = [
+                grid.torus_adj((x + dx, y + dy))
+                for (dx, dy), k in zip(OFFSETS, flow.offsets[x, y])
+                if k
+            ]
+            assert sorted(picked) == expected
@@ -0,0 +1,28 @@
+from pvp.batch import final
+from pvp.sweep import Sweep
+
+
+def test_sweep_numbers_every_add_on(tmp_path):
+    sweep = Sweep(str(tmp_path / "sweep.db"))
+    base = {"height": 15, "width": 15, "max_iters": 20, "log_every": None}
+    assert sweep.add([{**base, "ratio": 0.1}]) == 1
+    assert sweep.add([{**base, "ratio": 0.3}]) == 1
+    assert sweep.add([{**base, "ratio": 0.1}]) == 0
+    sweep.run(workers=1)
+    rows = final(sweep.frame())
+    assert rows["run"].tolist() == [0, 1]
+    assert rows["ratio"].tolist() == [0.1, 0.3]
+
+
+def test_sweep_logs_only_when_asked(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sweep = Sweep("sweep.db")
+    base = {"height": 15, "width": 15, "ratio": 0.5}
+    sweep.add([base], max_steps=25)
+    sweep.run(workers=1)
+    assert not (tmp_path / "experiments").exists()
+
+    sweep.add([{**base, "log_every": 10}], max_steps=25)
+    sweep.run(workers=1)
+    (log,) = (tmp_path / "experiments").glob("*.csv")
+    assert len(log.read_text().splitlines()) == 1 + 26